@@ -115,9 +115,9 @@ STOP_CMD     = b"rem stop\r"
 # -------------------------------------------------------------------
 def send_ack(shell_ser, proto, cmd: str, *, flag_name: str, label: str, timeout: float = 2.0) -> bool:
     setattr(proto, flag_name, True)
-    proto.response_event.clear()
+    last_gen = proto.response_gen
     shell_ser.write(cmd.encode() if isinstance(cmd, str) else cmd)
-    ok = proto.response_event.wait(timeout=timeout)
+    ok = proto.wait_response(last_gen, timeout)
     if ok:
         print(f"[ACK] {label}")
     else:
@@ -139,8 +139,8 @@ def init_module(shell_ser, proto, name: str, args: str) -> bool:
     if not send_ack(shell_ser, proto, cmd, flag_name="initcommand", label=f"INIT {name}", timeout=1.8):
         return False
     if not hasattr(proto, "start_responses"):
-        proto.start_responses = []
-    proto.start_responses.append(f"{name.upper()} OK")
+        proto.start_responses = set()
+    proto.start_responses.add(f"{name.upper()} OK".encode())
     return True
 
 def start_streaming(shell_ser, proto) -> bool:
@@ -202,7 +202,10 @@ def main():
             broker=mqtt_config.MQTT_BROKER,
             port=mqtt_config.MQTT_PORT,
             username=mqtt_config.MQTT_USERNAME,
-            password=mqtt_config.MQTT_PASSWORD
+            password=mqtt_config.MQTT_PASSWORD,
+            payload_format=mqtt_config.PAYLOAD_FORMAT,
+            compression=mqtt_config.PAYLOAD_COMPRESSION,
+            mqtt_v5=mqtt_config.MQTT_V5
         )
         
         if mqtt.connect():
@@ -35,6 +35,49 @@ auth_db = AuthDB('users.db')
 
 socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
 
+# ====== LETTURA LOG ANOMALIE ======
+
+ANOMALY_LOG_PREFIXES = {
+    'ecg': 'anomalies_',
+    'piezo': 'piezo_anomalies_',
+    'temp': 'temp_anomalies_'
+}
+
+def anomaly_log_exists(anomaly_dir, anomaly_type, date):
+    """True se esiste un log (.json o .jsonl) per il tipo e la data"""
+    prefix = ANOMALY_LOG_PREFIXES[anomaly_type]
+    return ((anomaly_dir / f"{prefix}{date}.json").exists()
+            or (anomaly_dir / f"{prefix}{date}.jsonl").exists())
+
+def load_anomaly_log(anomaly_dir, anomaly_type, date):
+    """
+    Anomalie registrate per una data: file .json (array) e/o .jsonl
+    (un record per riga, scritto in append dai detector)
+    """
+    prefix = ANOMALY_LOG_PREFIXES[anomaly_type]
+    anomalies = []
+    
+    json_file = anomaly_dir / f"{prefix}{date}.json"
+    if json_file.exists():
+        with open(json_file, 'r') as f:
+            data = json.load(f)
+        if isinstance(data, list):
+            anomalies.extend(data)
+    
+    jsonl_file = anomaly_dir / f"{prefix}{date}.jsonl"
+    if jsonl_file.exists():
+        with open(jsonl_file, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        anomalies.append(json.loads(line))
+                    except ValueError:
+                        continue  # riga in scrittura
+    
+    return anomalies
+
+
 # Global state
 class DashboardState:
     def __init__(self):
@@ -76,19 +119,10 @@ class DashboardState:
         
         today = datetime.now().strftime("%Y%m%d")
         
-        # File da controllare
-        files = {
-            'ecg': anomaly_dir / f"anomalies_{today}.json",
-            'piezo': anomaly_dir / f"piezo_anomalies_{today}.json",
-            'temp': anomaly_dir / f"temp_anomalies_{today}.json"
-        }
-        
-        for anomaly_type, file_path in files.items():
-            if file_path.exists():
+        for anomaly_type in counts:
+            if anomaly_log_exists(anomaly_dir, anomaly_type, today):
                 try:
-                    with open(file_path, 'r') as f:
-                        anomalies = json.load(f)
-                    counts[anomaly_type] = len(anomalies) if isinstance(anomalies, list) else 0
+                    counts[anomaly_type] = len(load_anomaly_log(anomaly_dir, anomaly_type, today))
                     print(f"[Startup] Found {counts[anomaly_type]} existing {anomaly_type.upper()} anomalies")
                 except Exception as e:
                     print(f"[Startup] Error reading {anomaly_type} anomalies: {e}")
@@ -210,22 +244,14 @@ def check_for_new_anomalies():
     
     today = datetime.now().strftime("%Y%m%d")
     
-    # File da monitorare
-    files_to_check = {
-        'ecg': anomaly_dir / f"anomalies_{today}.json",
-        'piezo': anomaly_dir / f"piezo_anomalies_{today}.json",
-        'temp': anomaly_dir / f"temp_anomalies_{today}.json"
-    }
-    
-    for anomaly_type, file_path in files_to_check.items():
-        if not file_path.exists():
+    for anomaly_type in ANOMALY_LOG_PREFIXES:
+        if not anomaly_log_exists(anomaly_dir, anomaly_type, today):
             continue
         
         try:
-            with open(file_path, 'r') as f:
-                anomalies = json.load(f)
+            anomalies = load_anomaly_log(anomaly_dir, anomaly_type, today)
             
-            current_count = len(anomalies) if isinstance(anomalies, list) else 0
+            current_count = len(anomalies)
             last_count = state.last_notification_counts[anomaly_type]
             
             # Se ci sono nuove anomalie
@@ -944,25 +970,21 @@ def get_anomaly_dates():
         
         dates_with_anomalies = set()
         
-        for log_file in anomaly_dir.glob("*.json"):
+        for log_file in anomaly_dir.glob("*.json*"):
             filename = log_file.stem
             date_str = None
             
-            if filename.startswith("anomalies_"):
-                date_str = filename.replace("anomalies_", "")
-            elif filename.startswith("piezo_anomalies_"):
-                date_str = filename.replace("piezo_anomalies_", "")
-            elif filename.startswith("temp_anomalies_"):
-                date_str = filename.replace("temp_anomalies_", "")
+            for anomaly_type, prefix in ANOMALY_LOG_PREFIXES.items():
+                if filename.startswith(prefix):
+                    date_str = filename.replace(prefix, "")
+                    break
             else:
                 continue
             
             if date_str and len(date_str) == 8 and date_str.isdigit():
                 try:
-                    with open(log_file, 'r') as f:
-                        data = json.load(f)
-                        if isinstance(data, list) and len(data) > 0:
-                            dates_with_anomalies.add(date_str)
+                    if load_anomaly_log(anomaly_dir, anomaly_type, date_str):
+                        dates_with_anomalies.add(date_str)
                 except:
                     continue
         
@@ -1010,35 +1032,20 @@ def get_anomalies_by_date(date):
         piezo_anomalies = []
         temp_anomalies = []
         
-        ecg_file = anomaly_dir / f"anomalies_{date}.json"
-        if ecg_file.exists():
-            try:
-                with open(ecg_file, 'r') as f:
-                    ecg_data = json.load(f)
-                    if isinstance(ecg_data, list):
-                        ecg_anomalies = ecg_data
-            except Exception as e:
-                app.logger.error(f"Errore lettura file ECG: {str(e)}")
-        
-        piezo_file = anomaly_dir / f"piezo_anomalies_{date}.json"
-        if piezo_file.exists():
-            try:
-                with open(piezo_file, 'r') as f:
-                    piezo_data = json.load(f)
-                    if isinstance(piezo_data, list):
-                        piezo_anomalies = piezo_data
-            except Exception as e:
-                app.logger.error(f"Errore lettura file PIEZO: {str(e)}")
-        
-        temp_file = anomaly_dir / f"temp_anomalies_{date}.json"
-        if temp_file.exists():
-            try:
-                with open(temp_file, 'r') as f:
-                    temp_data = json.load(f)
-                    if isinstance(temp_data, list):
-                        temp_anomalies = temp_data
-            except Exception as e:
-                app.logger.error(f"Errore lettura file TEMP: {str(e)}")
+        try:
+            ecg_anomalies = load_anomaly_log(anomaly_dir, 'ecg', date)
+        except Exception as e:
+            app.logger.error(f"Errore lettura file ECG: {str(e)}")
+        
+        try:
+            piezo_anomalies = load_anomaly_log(anomaly_dir, 'piezo', date)
+        except Exception as e:
+            app.logger.error(f"Errore lettura file PIEZO: {str(e)}")
+        
+        try:
+            temp_anomalies = load_anomaly_log(anomaly_dir, 'temp', date)
+        except Exception as e:
+            app.logger.error(f"Errore lettura file TEMP: {str(e)}")
         
         ecg_anomalies.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
         piezo_anomalies.sort(key=lambda x: x.get('timestamp', ''), reverse=True)
@@ -1083,16 +1090,14 @@ def get_anomalies_summary():
         total_temp = 0
         
         dates = set()
-        for log_file in anomaly_dir.glob("*.json"):
+        for log_file in anomaly_dir.glob("*.json*"):
             filename = log_file.stem
             date_str = None
             
-            if filename.startswith("anomalies_"):
-                date_str = filename.replace("anomalies_", "")
-            elif filename.startswith("piezo_anomalies_"):
-                date_str = filename.replace("piezo_anomalies_", "")
-            elif filename.startswith("temp_anomalies_"):
-                date_str = filename.replace("temp_anomalies_", "")
+            for prefix in ANOMALY_LOG_PREFIXES.values():
+                if filename.startswith(prefix):
+                    date_str = filename.replace(prefix, "")
+                    break
             else:
                 continue
             
@@ -1104,32 +1109,20 @@ def get_anomalies_summary():
             piezo_count = 0
             temp_count = 0
             
-            ecg_file = anomaly_dir / f"anomalies_{date}.json"
-            if ecg_file.exists():
-                try:
-                    with open(ecg_file, 'r') as f:
-                        ecg_data = json.load(f)
-                        ecg_count = len(ecg_data) if isinstance(ecg_data, list) else 0
-                except:
-                    pass
+            try:
+                ecg_count = len(load_anomaly_log(anomaly_dir, 'ecg', date))
+            except:
+                pass
             
-            piezo_file = anomaly_dir / f"piezo_anomalies_{date}.json"
-            if piezo_file.exists():
-                try:
-                    with open(piezo_file, 'r') as f:
-                        piezo_data = json.load(f)
-                        piezo_count = len(piezo_data) if isinstance(piezo_data, list) else 0
-                except:
-                    pass
+            try:
+                piezo_count = len(load_anomaly_log(anomaly_dir, 'piezo', date))
+            except:
+                pass
             
-            temp_file = anomaly_dir / f"temp_anomalies_{date}.json"
-            if temp_file.exists():
-                try:
-                    with open(temp_file, 'r') as f:
-                        temp_data = json.load(f)
-                        temp_count = len(temp_data) if isinstance(temp_data, list) else 0
-                except:
-                    pass
+            try:
+                temp_count = len(load_anomaly_log(anomaly_dir, 'temp', date))
+            except:
+                pass
             
             total_ecg += ecg_count
             total_piezo += piezo_count
@@ -1176,20 +1169,12 @@ def get_anomaly_detail(date, anomaly_type, index):
     try:
         anomaly_dir = Path("anomaly_logs")
         
-        if anomaly_type == 'ecg':
-            file_path = anomaly_dir / f"anomalies_{date}.json"
-        elif anomaly_type == 'piezo':
-            file_path = anomaly_dir / f"piezo_anomalies_{date}.json"
-        else:
-            file_path = anomaly_dir / f"temp_anomalies_{date}.json"
-        
-        if not file_path.exists():
+        if not anomaly_log_exists(anomaly_dir, anomaly_type, date):
             return jsonify({'error': 'File anomalie non trovato'}), 404
         
-        with open(file_path, 'r') as f:
-            anomalies = json.load(f)
+        anomalies = load_anomaly_log(anomaly_dir, anomaly_type, date)
         
-        if not isinstance(anomalies, list) or index < 0 or index >= len(anomalies):
+        if index < 0 or index >= len(anomalies):
             return jsonify({'error': 'Indice anomalia non valido'}), 404
         
         return jsonify({
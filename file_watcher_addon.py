@@ -1,111 +1,220 @@
+import heapq
+import queue
+import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional
 from watchdog.observers import Observer
-from watchdog.events import FileSystemEventHandler
+from watchdog.events import (FileSystemEventHandler, FileClosedEvent,
+                             FileCreatedEvent, FileModifiedEvent, FileMovedEvent)
 import logging
 
 logger = logging.getLogger(__name__)
 
+# On Linux, subscribe only to completed writes (IN_CLOSE_WRITE), creations and
+# renames instead of every IN_MODIFY: one event per write instead of a storm
+try:
+    from watchdog.observers.inotify import InotifyObserver
+    INOTIFY_AVAILABLE = True
+except Exception:
+    InotifyObserver = None
+    INOTIFY_AVAILABLE = False
+
+INOTIFY_EVENT_FILTER = [FileClosedEvent, FileCreatedEvent, FileMovedEvent]
+# Anomaly logs are written through handles the detectors keep open (no close
+# event per record); they change rarely and AnomalyWatcher debounces them
+ANOMALY_EVENT_FILTER = INOTIFY_EVENT_FILTER + [FileModifiedEvent]
+INOTIFY_SYNC_COOLDOWN = 0.1  # seconds, enough once modify storms are filtered out
+
+# Shared bounded pool for debounced anomaly syncs (no thread spawned per event)
+_SYNC_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix='anomaly-sync')
+
+# Filename classifiers (one regex pass, cached per filename)
+_SIG_RE = re.compile(r'(ECG|ADC|TEMP)_data|metadata')
+_ANOM_RE = re.compile(r'(piezo|temp|ecg)_anomalies|^anomalies_')
+
+
+@lru_cache(maxsize=512)
+def _classify_data_file(name: str) -> Optional[str]:
+    """Return 'ECG', 'ADC', 'TEMP', 'metadata' or None for a data_storage filename"""
+    m = _SIG_RE.search(name)
+    if not m:
+        return None
+    return m.group(1) or 'metadata'
+
+
+@lru_cache(maxsize=512)
+def _classify_anomaly_file(name: str) -> Optional[str]:
+    """Return 'ecg', 'piezo', 'temp' or None for an anomaly_logs filename"""
+    m = _ANOM_RE.search(name)
+    if not m:
+        return None
+    # Legacy anomalies_YYYYMMDD files are ECG anomalies
+    return m.group(1) or 'ecg'
+
 
 class DataStorageWatcher(FileSystemEventHandler):
     """Watch data_storage directory for changes"""
     
-    def __init__(self, publisher, base_dir):
+    def __init__(self, publisher, base_dir, sync_cooldown=2):
         self.publisher = publisher
         self.base_dir = Path(base_dir)
         self.last_sync = {}  # Track last sync time per file
-        self.sync_cooldown = 2  # seconds between syncs for same file
+        self.sync_cooldown = sync_cooldown  # seconds between syncs for same file
+        self.coalesce_window = 0.2  # seconds to gather events before syncing
+        
+        # Watchdog thread only enqueues paths; a worker coalesces and syncs them
+        self._queue = queue.SimpleQueue()
+        self._worker_thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self._worker_thread.start()
         
     def on_modified(self, event):
         if event.is_directory:
             return
-            
-        file_path = Path(event.src_path)
         
+        # Key tracking by the raw path string: no Path allocation per event
+        self._enqueue(event.src_path)
+    
+    def _enqueue(self, src):
+        """Queue a changed path for the sync worker"""
         # Only sync .jsonl and .json files
-        if file_path.suffix not in ['.jsonl', '.json']:
+        if not src.endswith(('.jsonl', '.json')):
             return
         
+        self._queue.put_nowait(src)
+    
+    def _worker_loop(self):
+        """Drain queued events, coalescing a burst into one sync per file"""
+        while True:
+            # dict keeps first-seen order while dropping duplicates
+            pending = {self._queue.get(): None}
+            deadline = time.monotonic() + self.coalesce_window
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    pending[self._queue.get(timeout=remaining)] = None
+                except queue.Empty:
+                    break
+            
+            for src in pending:
+                self._sync_path(src)
+    
+    def _sync_path(self, src):
+        """Sync a single changed file"""
         # Check cooldown
         now = time.time()
-        if file_path in self.last_sync:
-            if now - self.last_sync[file_path] < self.sync_cooldown:
+        if src in self.last_sync:
+            if now - self.last_sync[src] < self.sync_cooldown:
                 return
         
-        self.last_sync[file_path] = now
+        self.last_sync[src] = now
+        file_path = Path(src)
         
         # Determine signal type from filename
-        if 'ECG_data' in file_path.name:
-            signal_type = 'ECG'
-        elif 'ADC_data' in file_path.name:
-            signal_type = 'ADC'
-        elif 'TEMP_data' in file_path.name:
-            signal_type = 'TEMP'
-        elif 'metadata' in file_path.name:
-            signal_type = 'metadata'
-        else:
+        signal_type = _classify_data_file(file_path.name)
+        if signal_type is None:
             return
         
         logger.info(f"[FileWatcher] Detected change in {file_path.name}, syncing...")
         
         try:
             if signal_type == 'metadata':
-                self.publisher.sync_file(str(file_path), 'metadata')
+                self.publisher.sync_file(src, 'metadata')
             else:
                 # Sync data file in batches
-                self.publisher.sync_data_file_incremental(str(file_path), signal_type)
+                self.publisher.sync_data_file_incremental(src, signal_type)
         except Exception as e:
             logger.error(f"[FileWatcher] Error syncing {file_path}: {e}")
     
     def on_created(self, event):
         """Handle new files"""
         self.on_modified(event)
+    
+    def on_closed(self, event):
+        """Handle files closed after writing (inotify IN_CLOSE_WRITE)"""
+        self.on_modified(event)
+    
+    def on_moved(self, event):
+        """Handle files renamed into place"""
+        if not event.is_directory:
+            self._enqueue(event.dest_path)
 
 
 class AnomalyWatcher(FileSystemEventHandler):
     """Watch anomaly_logs directory for changes"""
     
-    def __init__(self, publisher, base_dir):
+    def __init__(self, publisher, base_dir, sync_cooldown=2):
         self.publisher = publisher
         self.base_dir = Path(base_dir)
         self.last_sync = {}
-        self.sync_cooldown = 2  # Increased cooldown
-        self.pending_syncs = {}  # Track pending sync timers
+        self.sync_cooldown = sync_cooldown  # Increased cooldown
+        self.debounce_delay = 1.0  # Seconds of inactivity before syncing
+        
+        # Debounce scheduler: latest deadline per file + min-heap of (deadline, path).
+        # Heap entries whose deadline no longer matches _deadlines are stale and skipped.
+        self._deadlines = {}
+        self._heap = []
+        self._cond = threading.Condition()
+        self._scheduler_thread = threading.Thread(target=self._scheduler_loop, daemon=True)
+        self._scheduler_thread.start()
         
     def on_modified(self, event):
         if event.is_directory:
             return
-            
-        file_path = Path(event.src_path)
+        
+        self._schedule(event.src_path)
+    
+    def _schedule(self, src):
+        """Schedule a debounced sync for a changed anomaly file"""
+        file_path = Path(src)
         
         # Accept both .json and .jsonl files
         if file_path.suffix not in ['.json', '.jsonl']:
             return
         
-        # Only sync anomaly files
-        if not any(x in file_path.name for x in ['anomalies_', 'ecg_anomalies', 'piezo_anomalies', 'temp_anomalies']):
-            return
-        
-        # Determine anomaly type from filename
-        if 'piezo_anomalies' in file_path.name:
-            anomaly_type = 'piezo'
-        elif 'temp_anomalies' in file_path.name:
-            anomaly_type = 'temp'
-        elif 'ecg_anomalies' in file_path.name or file_path.name.startswith('anomalies_'):
-            anomaly_type = 'ecg'
-        else:
+        # Only sync anomaly files, determining anomaly type from filename
+        anomaly_type = _classify_anomaly_file(file_path.name)
+        if anomaly_type is None:
             return
         
-        # Cancel any pending sync for this file
-        if file_path in self.pending_syncs:
-            self.pending_syncs[file_path].cancel()
-        
-        # Schedule a new sync after 1 second of inactivity
+        # (Re)schedule the sync after 1 second of inactivity, replacing any pending one
         # This ensures we only sync AFTER all write operations are complete
-        import threading
-        timer = threading.Timer(1.0, self._perform_sync, args=[file_path, anomaly_type])
-        timer.start()
-        self.pending_syncs[file_path] = timer
+        deadline = time.monotonic() + self.debounce_delay
+        with self._cond:
+            self._deadlines[file_path] = (deadline, anomaly_type)
+            heapq.heappush(self._heap, (deadline, file_path))
+            self._cond.notify()
+    
+    def _scheduler_loop(self):
+        """Wait for the earliest debounce deadline and dispatch its sync"""
+        while True:
+            with self._cond:
+                while True:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    
+                    deadline, file_path = self._heap[0]
+                    now = time.monotonic()
+                    if deadline > now:
+                        self._cond.wait(timeout=deadline - now)
+                        continue
+                    
+                    heapq.heappop(self._heap)
+                    pending = self._deadlines.get(file_path)
+                    if pending is None or pending[0] != deadline:
+                        continue  # Stale entry, superseded by a later event
+                    
+                    del self._deadlines[file_path]
+                    anomaly_type = pending[1]
+                    break
+            
+            _SYNC_POOL.submit(self._perform_sync, file_path, anomaly_type)
         
     def _perform_sync(self, file_path, anomaly_type):
         """Actually perform the sync after debounce period"""
@@ -122,15 +231,21 @@ class AnomalyWatcher(FileSystemEventHandler):
         
         try:
             self.publisher.sync_anomaly_file(str(file_path), anomaly_type)
-            # Remove from pending after successful sync
-            if file_path in self.pending_syncs:
-                del self.pending_syncs[file_path]
         except Exception as e:
             logger.error(f"[AnomalyWatcher] Error syncing {file_path}: {e}")
     
     def on_created(self, event):
         """Handle new anomaly files"""
         self.on_modified(event)
+    
+    def on_closed(self, event):
+        """Handle anomaly files closed after writing (inotify IN_CLOSE_WRITE)"""
+        self.on_modified(event)
+    
+    def on_moved(self, event):
+        """Handle anomaly files renamed into place"""
+        if not event.is_directory:
+            self._schedule(event.dest_path)
 
 
 def start_file_watchers(publisher, base_data_dir="./var/iit_data"):
@@ -154,14 +269,24 @@ def start_file_watchers(publisher, base_data_dir="./var/iit_data"):
     anomaly_logs_path.mkdir(parents=True, exist_ok=True)
     
     # Create observer
-    observer = Observer()
+    if INOTIFY_AVAILABLE:
+        # Kernel-level filtering: only close-after-write, create and move events
+        observer = InotifyObserver()
+        schedule_kwargs = {'event_filter': INOTIFY_EVENT_FILTER}
+        anomaly_schedule_kwargs = {'event_filter': ANOMALY_EVENT_FILTER}
+        sync_cooldown = INOTIFY_SYNC_COOLDOWN
+    else:
+        observer = Observer()
+        schedule_kwargs = {}
+        anomaly_schedule_kwargs = {}
+        sync_cooldown = 2
     
     # Add watchers
-    data_watcher = DataStorageWatcher(publisher, data_storage_path)
-    anomaly_watcher = AnomalyWatcher(publisher, anomaly_logs_path)
+    data_watcher = DataStorageWatcher(publisher, data_storage_path, sync_cooldown=sync_cooldown)
+    anomaly_watcher = AnomalyWatcher(publisher, anomaly_logs_path, sync_cooldown=sync_cooldown)
     
-    observer.schedule(data_watcher, str(data_storage_path), recursive=True)
-    observer.schedule(anomaly_watcher, str(anomaly_logs_path), recursive=True)
+    observer.schedule(data_watcher, str(data_storage_path), recursive=True, **schedule_kwargs)
+    observer.schedule(anomaly_watcher, str(anomaly_logs_path), recursive=True, **anomaly_schedule_kwargs)
     
     # Start observer
     observer.start()
@@ -1,15 +1,23 @@
 # handler_data.py
 
 from serial.threaded import Protocol
-import struct
-import pandas as pd
+import numpy as np
+import csv
 from kivy.clock import Clock
 from datetime import datetime
 import os
 #from registry import (get_control_panel, get_tab_content)
 from channel_manager import get_channel_manager
-from collections import deque, defaultdict
+from collections import deque, defaultdict, namedtuple
 import threading
+import queue
+from functools import lru_cache
+from itertools import repeat
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None     # optional: 20/24-bit unpacking falls back to pure Python
 #from filter_engine import has as filter_has, _REGISTRY, StreamingBlock
 _stream_blocks = {}     # signal_name -> StreamingBlock
 _perchan_state = {}     # signal_name -> list[dict]  (for builtin per-sample)
@@ -18,11 +26,18 @@ cm = get_channel_manager()
 
 
 PACKET_TYPES = {}
-TYPE_INDEX   = {}
+TYPE_INDEX   = [None] * 16   # indexed by the 4-bit header nibble; None = unknown type
+# TYPE_INDEX value: unpacked positionally in the parser hot path
+_Entry = namedtuple('Entry', 'name channels ch_labels data_rate')
+_ms_per_sample: dict[str, float] = {}       # signal_name -> 1000/data_rate, for the continuity check
+_sig_cfg: dict[str, tuple[int, bool]] = {}   # signal_name -> (nbits, signed), dropped on type change
 
 START_BYTE      = 0x02
 HEADER_SMALLX   = 4    # sizeof(t_header_smallx) == 1+1+2
 
+RX_BUFFER_SIZE  = 65536   # initial size of the parser's receive buffer
+RX_COMPACT_AT   = 32768   # compact the receive buffer once this many bytes are consumed
+
 sample_counters = defaultdict(int)  # how many samples emitted so far per signal
 last_device_ts  = {}    # last raw device timestamp seen per signal
 segment_counters       = defaultdict(int)   # how many samples in current file‐segment
@@ -82,12 +97,9 @@ def update_selected_packet_type(name: str, type_key: str):
 
     # Overwrite the single-nibble view used at runtime
     header = (full_hdr & 0xF0) >> 4
-    TYPE_INDEX[header] = {
-        'name':      entry['name'],
-        'channels':  entry['channels'],
-        'ch_labels': entry['ch_labels'],
-        'data_rate': entry['data_rate'],
-    }
+    TYPE_INDEX[header] = _Entry(entry['name'], entry['channels'],
+                                entry['ch_labels'], entry['data_rate'])
+    _ms_per_sample[name] = 1000.0 / entry['data_rate']
 
     print(f"[type_update] {name} → {type_key} | header=0x{header:X}  ch={entry['channels']} labels={entry['ch_labels']}")
 
@@ -99,6 +111,7 @@ for ch_name, info in cm.get_all_channels().items():
 
 #Updated PACKET TYPE AND TYPE_INDEX definitions upon change in Gui type or channel selection
 def _on_gui_type_selected(channel_name: str, new_type: str):
+    _sig_cfg.pop(channel_name, None)
     try:
         update_selected_packet_type(channel_name, new_type)
     except Exception as e:
@@ -108,6 +121,7 @@ cm.on('type_selected', _on_gui_type_selected)
 
 #
 
+@lru_cache(maxsize=64)
 def compute_tot_cols(channels: int, nbits: int) -> int:
     """How many 16-bit words exist per additional column.
        Computes the total columns based on the number of bits defined for a stream
@@ -123,6 +137,7 @@ def compute_tot_cols(channels: int, nbits: int) -> int:
         return channels * 2                      # low16 + high16 per channel
     return channels
 
+@lru_cache(maxsize=64)
 def infer_nbits_from_totcols(channels: int, wire_totcols: int) -> int | None:
     """Try to deduce 16/20/24/32 from the header's low nibble (wire_totcols)."""
     candidates = [bw for bw in (16, 20, 24, 32) if compute_tot_cols(channels, bw) == wire_totcols]
@@ -130,12 +145,38 @@ def infer_nbits_from_totcols(channels: int, wire_totcols: int) -> int | None:
         return candidates[0]
     return None  # ambiguous or inconsistent
 
-def _sign_extend(value: int, bits: int) -> int:
-    """EXTENDS SIGN assuming signed integer value streams"""
-    sign_bit = 1 << (bits - 1)
-    mask = (1 << bits) - 1
-    value &= mask
-    return (value ^ sign_bit) - sign_bit
+if njit is not None:
+    @njit(cache=True, boundscheck=False)
+    def _unpack20(words, channels, rows):
+        """JIT 20-bit unpacker: each extra word packs 4 high nibbles [ch0..ch3]
+           in bits [3:0],[7:4],[11:8],[15:12]. Returns int32[rows, channels]."""
+        tot_cols = channels + (channels + 1) // 4
+        out = np.empty((rows, channels), dtype=np.int32)
+        for r in range(rows):
+            base = r * tot_cols
+            for ch in range(channels):
+                v = np.int64(words[base + ch])
+                k = ch // 4
+                if channels + k < tot_cols:
+                    v |= ((np.int64(words[base + channels + k]) >> ((ch % 4) * 4)) & 0xF) << 16
+                out[r, ch] = (v << 44) >> 44       # arithmetic shift = 20-bit sign extension
+        return out
+
+    @njit(cache=True, boundscheck=False)
+    def _unpack24(words, channels, rows):
+        """JIT 24-bit unpacker: each extra word packs hi8 of an even channel in the
+           low byte and of the next odd channel in the high byte. Returns int32[rows, channels]."""
+        tot_cols = channels + (channels + 1) // 2
+        out = np.empty((rows, channels), dtype=np.int32)
+        for r in range(rows):
+            base = r * tot_cols
+            for ch in range(channels):
+                v = np.int64(words[base + ch])
+                k = ch // 2
+                if channels + k < tot_cols:
+                    v |= ((np.int64(words[base + channels + k]) >> ((ch % 2) * 8)) & 0xFF) << 16
+                out[r, ch] = (v << 40) >> 40       # arithmetic shift = 24-bit sign extension
+        return out
 
 class DataRawReader(Protocol):
     """Defines the data reading protocol the follows the follwing steps
@@ -145,77 +186,107 @@ class DataRawReader(Protocol):
     def __init__(self,packet_queue):
         super().__init__()
 
-        self.buffer =  bytearray()
-        # self.buffer = deque()
+        # Receive buffer with read/write cursors: consumed bytes are skipped by
+        # advancing _rpos and only compacted away every RX_COMPACT_AT bytes
+        self.buffer = bytearray(RX_BUFFER_SIZE)
+        self._rpos = 0
+        self._wpos = 0
         self.packet_queue = packet_queue
         self.last_timestamps = {}
         self.cm= get_channel_manager()
         
     def data_received(self, data):
         # print(self.buffer)
-        self.buffer.extend(data)
+        end = self._wpos + len(data)
+        if end > len(self.buffer):
+            self._compact()
+            end = self._wpos + len(data)
+            if end > len(self.buffer):
+                self.buffer.extend(bytes(end - len(self.buffer)))
+        self.buffer[self._wpos:end] = data
+        self._wpos = end
         self._process_buffer()
 
+    def _compact(self):
+        """Move the unread bytes to the front of the buffer"""
+        unread = self._wpos - self._rpos
+        if unread:
+            self.buffer[:unread] = self.buffer[self._rpos:self._wpos]
+        self._rpos = 0
+        self._wpos = unread
+
     def _process_buffer(self):
         # print(self.buffer)
+        # Hot loop state lives in locals (cursors, bound methods) and is written
+        # back once at the end; attribute access is the dominant cost here
+        buf = self.buffer
+        rpos = self._rpos
+        wpos = self._wpos
+        put = self.packet_queue.put
+        type_index = TYPE_INDEX
         try:
-            while len(self.buffer)>1:
+            while wpos - rpos > 1:
                  # 1) sync on START_BYTE
-                if self.buffer[0] != START_BYTE:
-                    self.buffer.pop(0)
-                    #buf.popleft()
+                if buf[rpos] != START_BYTE:
+                    # jump straight to the next candidate start byte (C-level memchr scan)
+                    idx = buf.find(START_BYTE, rpos, wpos)
+                    if idx == -1:
+                        rpos = wpos
+                        break
+                    rpos = idx
                     continue
 
                  # 2) read length
-                length = int.from_bytes([self.buffer[1]], byteorder='little', signed=False)
+                length = buf[rpos + 1]   # bytearray indexing already yields an int
                 # print(length)
 
                 # 3) wait until we have enough bytes for the small header
                 min_header_bytes = 2 + HEADER_SMALLX
-                if len(self.buffer) < min_header_bytes:
-                    return
+                if wpos - rpos < min_header_bytes:
+                    break
                 
                 # 4) peek into the small header at buf[2..5]
-                hdr_off      = 2
-                type_byte    = self.buffer[hdr_off]
-                rows_byte    = self.buffer[hdr_off + 1]
-                timestamp    = struct.unpack_from('<H', self.buffer, hdr_off + 2)[0]
+                hdr_off      = rpos + 2
+                type_byte    = buf[hdr_off]
+                rows_byte    = buf[hdr_off + 1]
+                timestamp    = buf[hdr_off + 2] | (buf[hdr_off + 3] << 8)  # little-endian u16
 
                 signal_type  = (type_byte & 0xF0) >> 4 #nibble packet identifier
                 wire_totcols =  type_byte & 0x0F            # low nibble = words/row on wiree
                 num_rows     =  rows_byte  & 0x7F  #2nd byte of header           
                 eof_flag     = bool(rows_byte & 0x80) #
 
-                entry = TYPE_INDEX.get(signal_type)
+                entry = type_index[signal_type]   # signal_type is a nibble: always 0..15
 
                 if entry is None:
-                    self.buffer.pop(0)
+                    rpos += 1
                     continue            
 
                 #check matching length = header row*col*2+4  and header type
                 expected_payload = num_rows * wire_totcols * 2
                 if (length != expected_payload + HEADER_SMALLX):
-                    self.buffer.pop(0)
+                    rpos += 1
                     continue
 
         #         # wait for full packet
                 total = 2 + length
-                if len(self.buffer) < total:
-                    return
+                if wpos - rpos < total:
+                    break
                 
-        #         # slice and enqueue
-                packet = bytes(self.buffer[:total])
-                del self.buffer[:total]
+        #         # copy only the payload out of the receive buffer (it gets overwritten)
+                # (memoryview slice: a single copy, no intermediate bytearray)
                 payload_start = hdr_off + HEADER_SMALLX
-                payload = packet[payload_start:payload_start + expected_payload]
+                with memoryview(buf) as view:
+                    payload = bytes(view[payload_start:payload_start + expected_payload])
+                rpos += total
 
 
-                name        = entry['name']  
-                labels      = entry['ch_labels']  
-                data_rate   = entry['data_rate']
-                num_ch         = entry['channels'] 
+                name, num_ch, labels, data_rate = entry
 
-                nbits    = cm.get_runtime_bit_width(name) or 16
+                cfg = _sig_cfg.get(name)
+                if cfg is None:
+                    cfg = _sig_cfg[name] = (cm.get_runtime_bit_width(name) or 16, cm.get_signed_data(name))
+                nbits = cfg[0]
 
                 #sanity-check against header's tot_cols; auto-correct if uniquely inferrable
                 expected_wire = compute_tot_cols(num_ch, nbits)
@@ -230,7 +301,7 @@ class DataRawReader(Protocol):
                         
                 # print(f"[DEBUG] Type {name} Expected {expected_wire}, Received {wire_totcols}, Rows {num_rows}")
 
-                self.packet_queue.put({
+                put({
                     'signal_type':  signal_type,
                     'signal_name':  name,
                     'ch_labels':    labels,
@@ -247,6 +318,13 @@ class DataRawReader(Protocol):
             
         except Exception as e:
              print(f"[ERROR] {e}")
+        finally:
+            if rpos == wpos:
+                self._rpos = self._wpos = 0
+            else:
+                self._rpos = rpos
+                if rpos > RX_COMPACT_AT:
+                    self._compact()
 
 
 def unpack_16bit_frames(payload: bytes, num_channels: int) -> list[list[int]]:
@@ -273,64 +351,124 @@ def unpack_frames(payload: bytes, channels: int, nbits: int,signal_name:str) ->
     Generic unpacker for 16/20/24/32 bit rows.
     Row layout: first `channels` words are low16; remaining words carry MSBs by scheme.
     This is the data unpacking function used 
+    Returns plain lists (frames are JSON-encoded downstream); see unpack_frames_array.
+    """
+    return unpack_frames_array(payload, channels, nbits, signal_name).tolist()
+
+
+def unpack_frames_array(payload: bytes, channels: int, nbits: int, signal_name: str) -> np.ndarray:
+    """
+    Same as unpack_frames, but returns the frames as one contiguous
+    (rows, channels) integer ndarray instead of a list of lists.
     """
-    if not payload:
-        return []
-    word_count = len(payload) // 2
-    words = list(struct.unpack('<' + 'H' * word_count, payload))
     tot_cols = compute_tot_cols(channels, nbits)
+    if not payload or not tot_cols:
+        return np.empty((0, channels), dtype=np.int32)
+    rows = (len(payload) // 2) // tot_cols
+    arr = np.frombuffer(payload, dtype='<u2', count=rows * tot_cols).reshape(rows, tot_cols)
 
-    frames = []
-    for row_start in range(0, word_count, tot_cols):
-        if row_start + tot_cols > word_count:
-            break
-        row = words[row_start:row_start + tot_cols]
-        low16s = row[:channels]
-        extras = row[channels:]
+    if nbits == 32:
+        # channels words in block order [low16][high16]*ch
+        lo = arr[:, 0:2 * channels:2].astype(np.uint32)
+        hi = arr[:, 1:2 * channels:2].astype(np.uint32)
+        return ((hi << 16) | lo).view(np.int32)
+
+    if nbits not in (20, 24):
+        # 16-bit (and unknown widths, read as signed 16)
+        low16s = arr[:, :channels]
+        cfg = _sig_cfg.get(signal_name)
+        if cfg is None:
+            cfg = _sig_cfg[signal_name] = (cm.get_runtime_bit_width(signal_name) or 16,
+                                           cm.get_signed_data(signal_name))
+        if nbits == 16 and not cfg[1]:
+            return np.ascontiguousarray(low16s)
+        return np.ascontiguousarray(low16s).view(np.int16)
+
+    if njit is not None:
+        kernel = _unpack20 if nbits == 20 else _unpack24
+        return kernel(arr.ravel(), channels, rows)
+
+    # NumPy fallback: gather the high bits per channel, then sign-extend with a
+    # shift pair on int32 (wrapping << then arithmetic >>)
+    extras = arr[:, channels:].astype(np.int32)
+    ch = np.arange(channels)
+    if nbits == 20:
+        # extras: ceil(ch/4) words; each packs 4 high nibbles [ch0..ch3] in bits [3:0],[7:4],[11:8],[15:12]
+        k, bit_off, hi_mask = ch // 4, (ch % 4) * 4, 0xF
+    else:
+        # extras: ceil(ch/2) words; low byte = hi8 for even ch, high byte = hi8 for odd ch
+        k, bit_off, hi_mask = ch // 2, (ch % 2) * 8, 0xFF
+    has_hi = k < extras.shape[1]
 
-        if nbits == 16:
-            if cm.get_signed_data(signal_name):
-                frame = [_sign_extend(x, 16) for x in low16s]
-            else:
-                frame=low16s
-
-        elif nbits == 20:
-            # extras: ceil(ch/4) words; each packs 4 high nibbles [ch0..ch3] in bits [3:0],[7:4],[11:8],[15:12]
-            hi4 = [0] * channels
-            for i, w in enumerate(extras):
-                base = i * 4
-                for k in range(4):
-                    ch = base + k
-                    if ch < channels:
-                        hi4[ch] = (w >> (k * 4)) & 0xF
-            frame = [_sign_extend(((hi4[ch] << 16) | (low16s[ch] & 0xFFFF)), 20) for ch in range(channels)]
-
-        elif nbits == 24:
-            # extras: ceil(ch/2) words; low byte = hi8 for even ch, high byte = hi8 for odd ch
-            hi8 = [0] * channels
-            for i, w in enumerate(extras):
-                even = i * 2
-                odd  = even + 1
-                if even < channels: hi8[even] = w & 0xFF
-                if odd  < channels: hi8[odd]  = (w >> 8) & 0xFF
-            frame = [_sign_extend(((hi8[ch] << 16) | (low16s[ch] & 0xFFFF)), 24) for ch in range(channels)]
-
-        elif nbits == 32:
-            # channels words in block order [low16][high16]*ch
-            if len(row) < channels*2:
-                break
-            frame = []
-            for ch in range(channels):
-                lo = row[2*ch] & 0xFFFF
-                hi = row[2*ch + 1] & 0xFFFF
-                frame.append(_sign_extend(((hi << 16) | lo), 32))
+    packed = arr[:, :channels].astype(np.int32)
+    packed[:, has_hi] |= ((extras[:, k[has_hi]] >> bit_off[has_hi]) & hi_mask) << 16
+    shift = 32 - nbits
+    return (packed << shift) >> shift
 
-        else:
-            frame = [_sign_extend(x, 16) for x in low16s]
 
-        frames.append(frame)
-    return frames
+CSV_WRITE_BUFFER = 1 << 16  # bytes buffered per open CSV file
 
+def _get_csv_writer(csv_writers: dict, opened_files: set, signal_name: str, filename: str, header: list):
+    """Return the csv.writer for signal_name, (re)opening it when the target file changes.
+       The file is kept open across packets; the header is written only the first time
+       the file is opened in this session (tracked in opened_files, no stat call).
+    """
+    current = csv_writers.get(signal_name)
+    if current is not None:
+        if current[0] == filename:
+            return current[2]
+        current[1].close()
+
+    write_header = filename not in opened_files
+    opened_files.add(filename)
+    f = open(filename, 'w' if write_header else 'a', newline='', buffering=CSV_WRITE_BUFFER)
+    writer = csv.writer(f)
+    if write_header:
+        writer.writerow(header)
+    csv_writers[signal_name] = (filename, f, writer)
+    return writer
+
+def _close_csv_writers(csv_writers: dict):
+    """Flush and close every open CSV file"""
+    for _, f, _ in csv_writers.values():
+        f.close()
+    csv_writers.clear()
+
+_csv_queue = queue.Queue(maxsize=256)   # (signal_name, filename, header, frames, base_idx, ts, data_rate) | None
+
+def _csv_worker(csv_queue):
+    """Write queued packets to their CSV files until a None sentinel arrives.
+       Owns the open writers, so a slow disk never stalls unpacking/plotting.
+    """
+    csv_writers = {}    # signal_name -> (filename, file, csv.writer)
+    opened_files = set()    # CSV files already created in the current recording
+    try:
+        while True:
+            item = csv_queue.get()
+            if item is None:
+                break
+            try:
+                signal_name, filename, header, frames, base_idx, nativets, data_rate = item
+                writer = _get_csv_writer(csv_writers, opened_files, signal_name, filename, header)
+                # Rows = elapsed‐seconds column + device timestamp + channel columns,
+                # zipped column-wise instead of built row by row
+                n_rows = frames.shape[0]
+                time_col = (base_idx + np.arange(n_rows, dtype=np.float64)) / data_rate
+                writer.writerows(zip(time_col.tolist(), repeat(nativets, n_rows), *frames.T.tolist()))
+            except Exception as e:
+                print(f"[ERROR] csv writer {e}")
+    finally:
+        _close_csv_writers(csv_writers)
+
+def _start_csv_worker() -> threading.Thread:
+    t = threading.Thread(target=_csv_worker, args=(_csv_queue,), name="csv-writer", daemon=True)
+    t.start()
+    return t
+
+def _stop_csv_worker(t: threading.Thread):
+    """Let the worker drain the queue, then close its files"""
+    _csv_queue.put(None)
+    t.join()
 
 def handler_data_fun(packet_queue, stop_event:threading.Event):
     """
@@ -343,6 +481,8 @@ def handler_data_fun(packet_queue, stop_event:threading.Event):
     control_panel = get_control_panel()
     # prepare a time‐stamped prefix for CSV files
     session_prefix = None
+    csv_thread = None   # CSV writer thread, alive while recording
+    created_dir = None  # output dir already ensured for the current recording
 
 
     while not stop_event.is_set():
@@ -357,19 +497,32 @@ def handler_data_fun(packet_queue, stop_event:threading.Event):
             nbits = pkt['nbits']
             # print(signal_name)
 
+            # Nothing to do for a signal that is neither plotted nor recorded:
+            # only keep the device timestamp so the continuity check stays valid
+            recording   = control_panel.get_recording_state()
+            plot_widget = tab_content.plots[signal_name]
+            if not recording and not (plot_widget and getattr(plot_widget, 'visible', True)):
+                last_device_ts[signal_name] = hdr_ts
+                session_prefix = None
+                if csv_thread is not None:
+                    _stop_csv_worker(csv_thread)
+                    csv_thread = None
+                continue
+
             # 1) unpack raw payload into frames
             #frames = unpack_16bit_frames(payload, nch)
-            frames = unpack_frames(payload, nch, nbits,signal_name)
-            n_rows = len(frames)
+            frames = unpack_frames_array(payload, nch, nbits, signal_name)   # (rows, channels)
+            n_rows = frames.shape[0]
             # print(frames)
 
             # 2) continuity check and detect lost samples
             lost = 0
             if signal_name in last_device_ts:
-                expected_ms = n_rows * (1000.0 / data_rate)
+                mps         = _ms_per_sample[signal_name]
+                expected_ms = n_rows * mps
                 delta_ms   = (hdr_ts - last_device_ts[signal_name]) & 0xFFFF
-                if abs(delta_ms - expected_ms) > (1000.0 / data_rate):
-                    lost = round((delta_ms - expected_ms) / (1000.0 / data_rate))
+                if abs(delta_ms - expected_ms) > mps:
+                    lost = round((delta_ms - expected_ms) / mps)
                     # print(f"[WARN] {signal_name}: detected ~{lost} lost samples")
             last_device_ts[signal_name] = hdr_ts
             # print(f"[TS]: {signal_name} {hdr_ts}")
@@ -377,20 +530,18 @@ def handler_data_fun(packet_queue, stop_event:threading.Event):
 
             # print(tab_content.plots[signal_name])
             # 2) dispatch to the right PlotWidget
-            plot_widget = tab_content.plots[signal_name]
-            
             if plot_widget:
-                for frame in frames:
-                    upto = min(len(plot_widget.signal_data), len(frame))
-                    for i in range(upto):
-                        plot_widget.signal_data[i].append(frame[i])
+                # one C-level transpose+conversion, then one extend per channel
+                # (zip stops at the shorter of plot channels / packet channels)
+                for series, column in zip(plot_widget.signal_data, frames.T.tolist()):
+                    series.extend(column)
 
                     #for i in range(plot_widget.n_ch):
                         #plot_widget.signal_data[i].append(frame[i])
                         #maybe handle lost packets
 
             # 3) save to CSV if recording
-            if control_panel.get_recording_state():
+            if recording:
                 # initialize session prefix
                 if session_prefix is None:
                     # fresh recording start: clear _all_ counters & start segment 0
@@ -400,23 +551,21 @@ def handler_data_fun(packet_queue, stop_event:threading.Event):
                     last_device_ts.clear()
                     segment_counters.clear()
                     segment_indices.clear()
+                    created_dir = None
+
+                if csv_thread is None:
+                    csv_thread = _start_csv_worker()
 
                 # Determine segmentation parameters
                 sel_type    = cm.get_selected_type(signal_name)
                 seg_secs    = cm.get_max_record(signal_name, sel_type) or 0
                 out_dir     = control_panel.get_path()
-                os.makedirs(out_dir, exist_ok=True)
-                # Build rows of data with elapsed‐seconds timestamp + channel columns
+                if out_dir != created_dir:
+                    os.makedirs(out_dir, exist_ok=True)
+                    created_dir = out_dir
                 base_idx = sample_counters[signal_name]
                 nativets = last_device_ts[signal_name]
-                rows = []
                 #maybe add placeholders for lost packets
-                for i, frame in enumerate(frames):
-                    rows.append({
-                        'time_s': (base_idx + i) / data_rate,
-                        'TS':(nativets),
-                        **dict(zip(labels, frame))
-                    })
                 sample_counters[signal_name]   += n_rows
                 segment_counters[signal_name]  += n_rows
 
@@ -426,15 +575,9 @@ def handler_data_fun(packet_queue, stop_event:threading.Event):
                 # suffix    = f"_{idx}" if idx > 0 else ""
                 # filename  = os.path.join(out_dir, f"{base_name}{suffix}.csv")
                 filename  = os.path.join(out_dir, f"{base_name}.csv")
-                # Write header only if file is new
-                write_header = not os.path.exists(filename)
-                df = pd.DataFrame(rows)
-                df.to_csv(
-                    filename,
-                    index=False,
-                    header=write_header,
-                    mode='a' if not write_header else 'w'
-                )                
+                # Hand the rows to the CSV writer thread (blocks if the disk falls behind)
+                _csv_queue.put((signal_name, filename, ['time_s', 'TS', *labels],
+                                frames, base_idx, nativets, data_rate))
 
                 # Rotate to next file when capacity reached
                 if seg_secs and segment_counters[signal_name] >= seg_secs * data_rate:
@@ -447,10 +590,16 @@ def handler_data_fun(packet_queue, stop_event:threading.Event):
             else:
                 # Stop recording: reset session_prefix so next start re‐initializes
                 session_prefix = None                    
+                if csv_thread is not None:
+                    _stop_csv_worker(csv_thread)
+                    csv_thread = None
 
         except Exception as e:
             print(f"[ERROR] handler {e}")
 
+    if csv_thread is not None:
+        _stop_csv_worker(csv_thread)
+
 
         
         
\ No newline at end of file
@@ -8,6 +8,9 @@ MQTT_USERNAME = None
 MQTT_PASSWORD = None
 MQTT_CLIENT_ID = "iit_device_001"
 MQTT_QOS = 1
+# MQTT v5 lets realtime frames use 2-byte topic aliases instead of the full
+# topic string; only enable it if the broker (and any bridge) supports v5
+MQTT_V5 = False
 
 # ========================================
 # Publishing Configuration
@@ -22,6 +25,15 @@ PUBLISH_SYNC = True              # File synchronization
 STORAGE_BATCH_SIZE = 100         # Frames per batch for storage data
 ANOMALY_BATCH_SIZE = 10          # Anomalies per batch
 
+# Wire format for incremental storage syncs: "json" or "msgpack"
+# (msgpack is ~half the size; subscribers must decode with msgpack.unpackb(raw, raw=False))
+PAYLOAD_FORMAT = "json"
+
+# Compression for payloads over 1 KiB: None or "zstd" (requires: pip install zstandard)
+# Compressed messages are published on "<topic>/zstd"; subscribers decode with
+# zstandard.ZstdDecompressor().decompressobj().decompress(raw)
+PAYLOAD_COMPRESSION = None
+
 # ========================================
 # Synchronization Configuration
 # ========================================
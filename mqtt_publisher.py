@@ -5,6 +5,10 @@ Maintains full folder structure synchronization with local system
 
 Requirements:
     pip install paho-mqtt
+    pip install msgpack  (optional, for PAYLOAD_FORMAT = "msgpack")
+    pip install orjson   (optional, faster JSON encoding)
+    pip install zstandard  (optional, for PAYLOAD_COMPRESSION = "zstd")
+    pip install watchdog   (optional, event-driven file sync)
 
 Features:
     - Real-time data publishing
@@ -14,20 +18,86 @@ Features:
     - File structure mirroring
     - Automatic cleanup synchronization
 """
+import atexit
+import base64
 import json
+import os
+import queue
+import socket
 import threading
 import time
 import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from collections import deque
 from pathlib import Path
 from typing import Dict, List, Optional
 import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler = object
+    Observer = None
+
+if orjson is not None:
+    # bytes out (no str -> encode round-trip); numpy arrays and int keys like json.dumps
+    _ORJSON_OPTS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    
+    def _dumps(data):
+        return orjson.dumps(data, option=_ORJSON_OPTS)
+else:
+    _dumps = json.dumps
+
+
+# Growing signal data files: synced line by line by sync_data_file_incremental
+# (file_watcher_addon), never re-sent whole on each write
+_INCREMENTAL_DATA_FILES = frozenset(('ECG_data.jsonl', 'ADC_data.jsonl', 'TEMP_data.jsonl'))
+
+
+class _SyncEventHandler(FileSystemEventHandler):
+    """Queue the paths of changed files under a mirrored directory for the sync thread"""
+    
+    # 'opened' / 'closed_no_write' carry no change
+    _CHANGE_EVENTS = frozenset(('created', 'modified', 'closed', 'deleted', 'moved'))
+    
+    def __init__(self, changes):
+        self._changes = changes
+    
+    def on_any_event(self, event):
+        if event.is_directory or event.event_type not in self._CHANGE_EVENTS:
+            return
+        self._put(event.src_path)
+        if event.event_type == 'moved':
+            self._put(event.dest_path)
+    
+    def _put(self, path):
+        # Only metadata/anomaly/other small files; data files have their own path
+        if os.path.basename(path) not in _INCREMENTAL_DATA_FILES:
+            self._changes.put_nowait(path)
 
 
 class MQTTPublisher:
     def __init__(self, broker, port=1883, username=None, password=None, 
-                 client_id="iit_device", qos=1):
+                 client_id="iit_device", qos=1, payload_format="json",
+                 compression=None, mqtt_v5=False):
         """
         Initialize MQTT Publisher with extended sync capabilities
         
@@ -38,6 +108,11 @@ class MQTTPublisher:
             password: MQTT password (optional)
             client_id: Unique client identifier
             qos: Quality of Service (0, 1, or 2)
+            payload_format: Wire format for batch syncs, "json" or "msgpack"
+            compression: None, or "zstd" to compress payloads larger than
+                compress_threshold bytes (published on "<topic>/zstd")
+            mqtt_v5: Connect with MQTT v5 and send realtime frames with topic
+                aliases (opt-in: brokers/bridges that only speak v3.1.1 refuse it)
         """
         self.broker = broker
         self.port = port
@@ -46,8 +121,28 @@ class MQTTPublisher:
         self.client_id = client_id
         self.qos = qos
         
+        if payload_format == "msgpack" and msgpack is None:
+            print("[MQTT] msgpack not installed, falling back to JSON payloads. Run: pip install msgpack")
+            payload_format = "json"
+        self.payload_format = payload_format
+        
+        if compression == "zstd" and zstandard is None:
+            print("[MQTT] zstandard not installed, sending payloads uncompressed. Run: pip install zstandard")
+            compression = None
+        # One compressor reused for every message (context/thread setup paid once)
+        self._zctx = zstandard.ZstdCompressor(level=3, threads=-1) if compression == "zstd" else None
+        self.compress_threshold = 1024
+        
         # MQTT client
-        self.client = mqtt.Client(client_id=client_id)
+        self.mqtt_v5 = mqtt_v5
+        self.client = mqtt.Client(client_id=client_id,
+                                  protocol=mqtt.MQTTv5 if mqtt_v5 else mqtt.MQTTv311)
+        
+        # Pipeline QoS>0 publishes: a wide in-flight window makes throughput
+        # bandwidth-bound instead of one PUBACK round-trip per message
+        self.client.max_inflight_messages_set(1000)
+        self.client.max_queued_messages_set(0)  # 0 = unlimited
+        self.client.reconnect_delay_set(min_delay=1, max_delay=30)
         
         # Set callbacks
         self.client.on_connect = self._on_connect
@@ -63,11 +158,32 @@ class MQTTPublisher:
         self.reconnect_delay = 5
         
         # Publishing buffer
-        self.publish_buffer = deque(maxlen=10000)
-        self.buffer_lock = threading.Lock()
+        # One queue + worker thread per traffic class, so bulk storage/sync
+        # publishes never delay realtime frames or anomalies
+        # (SimpleQueue: C-level put/get, no Python lock; each bounded by max_buffer_size)
+        self.publish_buffers = {
+            'realtime': queue.SimpleQueue(),
+            'storage': queue.SimpleQueue(),
+            'anomaly': queue.SimpleQueue(),
+            'sync': queue.SimpleQueue()
+        }
+        self.max_buffer_size = 10000
+        # Anomalies get far more room than other classes, but still a hard cap
+        self.max_anomaly_buffer_size = 50000
+        self.realtime_qos = 0  # realtime frames are superseded quickly: no PUBACK round-trip
+        
+        # Realtime/storage frames are coalesced per topic into one message by the
+        # worker thread that owns the topic's queue (no shared state, no lock);
+        # flushed after coalesce_window seconds or coalesce_max_frames frames
+        self.coalesce_window = 0.05
+        self.coalesce_max_frames = 200
+        
+        # Optional CPU pinning, e.g. {'network': {0}, 'buffer': {1}} keeps paho's
+        # network thread and the publish workers off each other's core (Linux only)
+        self.thread_cpus = {}
         
         # Background thread
-        self._buffer_thread = None
+        self._buffer_threads = []
         self._stop_buffer = threading.Event()
         
         # Extended Topics - now includes anomalies and sync
@@ -92,47 +208,123 @@ class MQTTPublisher:
             'metadata': 'iit/device/metadata',
             'sync': {
                 'file_update': 'iit/device/sync/file_update',
+                'file_update_raw': 'iit/device/sync/file_update/raw',
                 'file_delete': 'iit/device/sync/file_delete',
                 'structure': 'iit/device/sync/structure',
                 'cleanup': 'iit/device/sync/cleanup'
             }
         }
         
+        # Flat topic lookups for the hot publish paths (no nested lookup / .upper())
+        self._realtime_topic = dict(self.topics['realtime'])
+        self._storage_topic = dict(self.topics['storage'])
+        self._anomaly_topic = {k.lower(): v for k, v in self.topics['anomalies'].items()}
+        
+        # Buffered topic -> its traffic class queue (anything else goes to 'sync')
+        self._topic_buffer = {}
+        for topic in self._realtime_topic.values():
+            self._topic_buffer[topic] = self.publish_buffers['realtime']
+        for topic in self._storage_topic.values():
+            self._topic_buffer[topic] = self.publish_buffers['storage']
+        for topic in self._anomaly_topic.values():
+            self._topic_buffer[topic] = self.publish_buffers['anomaly']
+        
+        # ISO timestamp cached per 10 ms tick for the hot paths (see _now_iso)
+        self._ts_cached = datetime.now().isoformat()
+        self._ts_last = time.monotonic()
+        
+        # MQTT v5 topic aliases (see _publish_aliased): topic -> prebuilt PUBLISH
+        # properties. Aliases live for one connection, so the map is reset on
+        # every (dis)connect and _alias_max comes from the broker's CONNACK.
+        # _alias_lock serializes the network thread's resets with the realtime
+        # worker's lookup+publish, so no alias outlives its connection
+        self._topic_aliases = {}
+        self._alias_max = 0
+        self._alias_lock = threading.Lock()
+        
+        # Fields shared by every client-originated message (see _envelope_with)
+        self._envelope = {'client_id': client_id}
+        
         # File tracking for synchronization
-        self.tracked_files = {}  # path -> {hash, last_modified, size}
+        self.tracked_files = {}  # path -> {hash, last_modified, mtime_ns, size}
+        self._tracked_by_prefix = {}  # ancestor dir -> set of tracked paths below it
         self.sync_lock = threading.Lock()
         
         # Sync thread
         self._sync_thread = None
         self._stop_sync = threading.Event()
         self.sync_interval = 60  # Check for changes every 60 seconds
+        # With watchdog, changes are synced as their events arrive and the full
+        # directory pass only runs every reconcile_interval as a safety net
+        self.reconcile_interval = 600
+        self.sync_dirs = ('data_storage', 'anomaly_logs')
+        self._sync_changes = queue.SimpleQueue()  # changed paths from the observer
+        # One burst of events is collected for at most this long / this many
+        # paths, so a steady event stream cannot hold off the reconcile pass
+        self.sync_batch_window = 2.0
+        self.sync_batch_max = 256
+        self._sync_observer = None
+        self.sync_workers = 8    # files stat'ed/hashed/published concurrently per pass
+        self.chunked_sync_threshold = 256 * 1024  # larger files are sent in chunks
+        self.sync_chunk_size = 64 * 1024
+        # Opt-in: send file contents as raw bytes on file_update/raw (see
+        # _header_payload) instead of JSON on file_update; only enable once the
+        # receiver subscribes to the raw topic
+        self.raw_file_sync = False
+        
+        # Incremental sync state: read position and persistent reader per data file
+        self._file_positions = {}  # path -> last read byte offset
+        self._file_handles = {}    # path -> open binary reader
+        self._hash_state = {}      # path -> running sha256 of the bytes synced so far
+        self.max_file_handles = 16
+        atexit.register(self._close_file_handles)
         
         # Statistics
         self.stats = {
             'messages_sent': 0,
             'messages_failed': 0,
+            'messages_dropped': 0,   # total of the three kinds below
+            'realtime_shed': 0,      # new realtime messages refused near full
+            'buffer_evicted': 0,     # oldest storage/sync messages evicted when full
+            'anomalies_evicted': 0,  # oldest anomalies evicted past max_anomaly_buffer_size
             'bytes_sent': 0,
             'anomalies_sent': 0,
             'files_synced': 0,
             'last_publish': None,
             'last_sync': None
         }
+        # Counter updates come from several threads (buffer, sync pool, watchers);
+        # the lock makes each += a fetch-add, reads stay lock-free
+        self._stats_lock = threading.Lock()
+        
+        # Per-type anomaly batch publishers with topic and encoder bound once
+        self._anomaly_emitters = {t: self._make_anomaly_emitter(t) for t in self._anomaly_topic}
     
-    def _on_connect(self, client, userdata, flags, rc):
+    def _on_connect(self, client, userdata, flags, rc, properties=None):
         """Callback when connected to broker"""
         if rc == 0:
+            with self._alias_lock:
+                self._topic_aliases = {}
+                self._alias_max = getattr(properties, 'TopicAliasMaximum', 0) if properties else 0
             self.connected = True
             print(f"[MQTT] Connected to broker {self.broker}:{self.port}")
             
+            # Disable Nagle (on every (re)connect): small status/anomaly
+            # publishes go out immediately instead of waiting to be coalesced
+            sock = client.socket()
+            if sock is not None:
+                try:
+                    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                except OSError as e:
+                    print(f"[MQTT] Could not set TCP_NODELAY: {e}")
+            
             # Publish status message
             self._publish_direct(
                 self.topics['status'],
-                {
+                self._envelope_with({
                     'status': 'connected',
-                    'timestamp': datetime.now().isoformat(),
-                    'client_id': self.client_id,
                     'capabilities': ['realtime', 'storage', 'anomalies', 'sync']
-                }
+                })
             )
             
             # Send initial folder structure
@@ -141,9 +333,14 @@ class MQTTPublisher:
             self.connected = False
             print(f"[MQTT] Connection failed with code {rc}")
     
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, userdata, rc, properties=None):
         """Callback when disconnected from broker"""
         self.connected = False
+        # No aliasing until the next CONNACK: paho accepts QoS 0 publishes on
+        # the new socket before on_connect runs
+        with self._alias_lock:
+            self._topic_aliases = {}
+            self._alias_max = 0
         print(f"[MQTT] Disconnected from broker (code: {rc})")
         
         if rc != 0:
@@ -152,7 +349,22 @@ class MQTTPublisher:
     def _on_publish(self, client, userdata, mid):
         """Callback when message is published"""
         self.stats['messages_sent'] += 1
-        self.stats['last_publish'] = datetime.now().isoformat()
+        self.stats['last_publish'] = self._now_iso()
+    
+    def _now_iso(self):
+        """datetime.now().isoformat(), refreshed at most every 10 ms"""
+        now = time.monotonic()
+        if now - self._ts_last > 0.01:
+            self._ts_cached = datetime.now().isoformat()
+            self._ts_last = now
+        return self._ts_cached
+    
+    def _envelope_with(self, fields):
+        """Message = shared envelope (client_id) + cached timestamp + fields"""
+        message = self._envelope.copy()
+        message['timestamp'] = self._now_iso()
+        message.update(fields)
+        return message
     
     def connect(self):
         """Connect to MQTT broker"""
@@ -162,6 +374,7 @@ class MQTTPublisher:
             
             # Start network loop in background
             self.client.loop_start()
+            self._pin_thread(getattr(self.client, '_thread', None), 'network')
             
             # Wait for connection
             timeout = 10
@@ -188,27 +401,33 @@ class MQTTPublisher:
     def disconnect(self):
         """Disconnect from MQTT broker"""
         # Stop sync thread
+        if self._sync_observer is not None:
+            self._sync_observer.stop()
+            self._sync_observer.join(timeout=5)
+            self._sync_observer = None
         if self._sync_thread and self._sync_thread.is_alive():
             self._stop_sync.set()
+            self._sync_changes.put_nowait(None)  # wake the thread if it is waiting for events
             self._sync_thread.join(timeout=5)
         
         # Stop buffer thread
-        if self._buffer_thread and self._buffer_thread.is_alive():
-            self._stop_buffer.set()
-            self._buffer_thread.join(timeout=5)
+        self._stop_buffer.set()
+        for thread in self._buffer_threads:
+            thread.join(timeout=5)
+        self._buffer_threads = []
         
         # Publish disconnect status
         if self.connected:
             self._publish_direct(
                 self.topics['status'],
-                {
+                self._envelope_with({
                     'status': 'disconnected',
-                    'timestamp': datetime.now().isoformat(),
-                    'client_id': self.client_id,
                     'statistics': self.stats
-                }
+                })
             )
         
+        self._close_file_handles()
+        
         # Stop MQTT loop and disconnect
         self.client.loop_stop()
         self.client.disconnect()
@@ -217,56 +436,151 @@ class MQTTPublisher:
     
     def _publish_direct(self, topic, data):
         """Publish directly without buffering (for critical messages)"""
+        return self._publish_direct_info(topic, data) is not None
+    
+    def _publish_direct_info(self, topic, data):
+        """
+        Publish directly without buffering
+        Returns the MQTTMessageInfo of a queued message (usable for
+        wait_for_publish), or None on failure
+        """
         try:
-            payload = json.dumps(data)
+            # Pre-encoded payloads (e.g. msgpack batches) are sent as-is
+            payload = data if isinstance(data, bytes) else _dumps(data)
+            topic, payload = self._compress(topic, payload)
+            nbytes = len(payload)
             result = self.client.publish(topic, payload, qos=self.qos)
             
             if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                self.stats['bytes_sent'] += len(payload)
-                return True
+                self._count_bytes(nbytes)
+                return result
             else:
                 print(f"[MQTT] Publish failed: {result.rc}")
                 self.stats['messages_failed'] += 1
-                return False
+                return None
                 
         except Exception as e:
             print(f"[MQTT] Publish error: {e}")
             self.stats['messages_failed'] += 1
-            return False
+            return None
+    
+    def _publish_aliased(self, topic, payload):
+        """
+        QoS 0 publish using an MQTT v5 topic alias
+        The first publish on a topic carries the full topic plus the alias it
+        binds; later ones send an empty topic and the 2-byte alias only.
+        Only used for QoS 0 (realtime worker thread): QoS>0 messages can be
+        retransmitted on a new connection where the alias no longer exists
+        """
+        with self._alias_lock:
+            aliases = self._topic_aliases
+            props = aliases.get(topic)
+            if props is not None:
+                return self.client.publish("", payload, qos=0, properties=props)
+            
+            if len(aliases) >= self._alias_max:
+                # v3.1.1, broker without alias support, or alias slots used up
+                return self.client.publish(topic, payload, qos=0)
+            props = Properties(PacketTypes.PUBLISH)
+            props.TopicAlias = len(aliases) + 1
+            result = self.client.publish(topic, payload, qos=0, properties=props)
+            if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                aliases[topic] = props
+            return result
+    
+    def _count_bytes(self, nbytes):
+        """Add to stats['bytes_sent'] atomically"""
+        with self._stats_lock:
+            self.stats['bytes_sent'] += nbytes
+    
+    def _compress(self, topic, payload):
+        """
+        zstd-compress large payloads (structure syncs, file contents, log files)
+        Compressed messages go to "<topic>/zstd" so receivers know to decode them
+        """
+        if self._zctx is None or len(payload) <= self.compress_threshold:
+            return topic, payload
+        if isinstance(payload, str):
+            payload = payload.encode()
+        return topic + '/zstd', self._zctx.compress(payload)
+    
+    def _make_anomaly_emitter(self, anomaly_type):
+        """
+        Build a publisher for anomaly sync batches of one type
+        The topic is resolved here, once, instead of per batch; publishing goes
+        through _publish_direct_info, so compression, stats and error handling
+        match every other direct publish
+        Returns emit(file_name, batch, batch_idx, total) -> MQTTMessageInfo or None
+        """
+        topic = self._anomaly_topic[anomaly_type]
+        publish_info = self._publish_direct_info
+        
+        def emit(file_name, batch, batch_idx, total):
+            return publish_info(topic, {
+                'anomaly_type': anomaly_type,
+                'file_name': file_name,  # Add filename for receiver
+                'anomalies': batch,
+                'timestamp': time.time(),
+                'batch': batch_idx,
+                'total_anomalies': total
+            })
+        
+        return emit
     
     def publish_realtime(self, signal_name, frames, timestamp=None):
         """Publish real-time data"""
-        if signal_name not in self.topics['realtime']:
+        topic = self._realtime_topic.get(signal_name)
+        if topic is None:
             return
         
-        topic = self.topics['realtime'][signal_name]
-        current_time = timestamp or datetime.now().isoformat()
-        
-        message = {
-            'signal': signal_name,
-            'timestamp': current_time,
-            'frames': frames,
-            'frame_count': len(frames)
-        }
-        
-        self._add_to_buffer(topic, message)
+        current_time = timestamp or self._now_iso()
+        # Frame chunk (tuple): merged by the buffer worker. Copied, so callers
+        # may reuse/clear their list
+        self._add_to_buffer(topic, (signal_name, list(frames), current_time))
     
     def publish_storage(self, signal_name, frames, timestamp=None):
         """Publish data for storage (can be batched)"""
-        if signal_name not in self.topics['storage']:
+        topic = self._storage_topic.get(signal_name)
+        if topic is None:
             return
         
-        topic = self.topics['storage'][signal_name]
-        current_time = timestamp or datetime.now().isoformat()
+        current_time = timestamp or self._now_iso()
+        self._add_to_buffer(topic, (signal_name, list(frames), current_time))
+    
+    def _merge_frames(self, pending, topic, chunk):
+        """
+        Merge a frame chunk into the worker-local pending message of its topic
+        Returns the finished message once it holds coalesce_max_frames frames
+        """
+        signal_name, frames, timestamp = chunk
+        entry = pending.get(topic)
+        if entry is None:
+            entry = pending[topic] = {
+                'signal': signal_name,
+                'frames': frames,  # the chunk's own copy becomes the accumulator
+                'first_ts': timestamp,
+                'last_ts': timestamp,
+                'opened': time.monotonic()
+            }
+        else:
+            entry['frames'].extend(frames)
+            entry['last_ts'] = timestamp
         
-        message = {
-            'signal': signal_name,
-            'timestamp': current_time,
+        if len(entry['frames']) >= self.coalesce_max_frames:
+            return self._coalesced_message(topic, pending.pop(topic))
+        return None
+    
+    @staticmethod
+    def _coalesced_message(topic, entry):
+        """Build the buffered (topic, message) of a pending coalesced entry"""
+        frames = entry['frames']
+        return topic, {
+            'signal': entry['signal'],
+            'timestamp': entry['first_ts'],
+            'last_timestamp': entry['last_ts'],
             'frames': frames,
             'frame_count': len(frames)
         }
-        
-        self._add_to_buffer(topic, message)
     
     def publish_anomaly(self, anomaly_type: str, anomaly_data: Dict):
         """
@@ -276,19 +590,16 @@ class MQTTPublisher:
             anomaly_type: 'ecg', 'piezo', or 'temp'
             anomaly_data: Anomaly detection result dictionary
         """
-        anomaly_type_upper = anomaly_type.upper()
-        if anomaly_type_upper not in self.topics['anomalies']:
+        topic = self._anomaly_topic.get(anomaly_type.lower())
+        if topic is None:
             print(f"[MQTT] Unknown anomaly type: {anomaly_type}")
             return
         
-        topic = self.topics['anomalies'][anomaly_type_upper]
-        
-        message = {
+        message = self._envelope_with({
             'anomaly_type': anomaly_type,
-            'timestamp': anomaly_data.get('timestamp', datetime.now().isoformat()),
-            'data': anomaly_data,
-            'client_id': self.client_id
-        }
+            'timestamp': anomaly_data.get('timestamp') or self._now_iso(),
+            'data': anomaly_data
+        })
         
         # Direct publish for anomalies (high priority)
         if self._publish_direct(topic, message):
@@ -317,16 +628,14 @@ class MQTTPublisher:
                     print(f"[MQTT] CSV format not supported for full file sync")
                     return
             
-            message = {
+            message = self._envelope_with({
                 'type': 'anomaly_log_file',
                 'anomaly_type': anomaly_type,
                 'file_name': log_path.name,
                 'date': log_path.stem.split('_')[-1],  # Extract date from filename
                 'anomalies': anomalies,
-                'count': len(anomalies),
-                'timestamp': datetime.now().isoformat(),
-                'client_id': self.client_id
-            }
+                'count': len(anomalies)
+            })
             
             topic = self.topics['anomalies'][anomaly_type.upper()]
             self._add_to_buffer(topic, message)
@@ -341,7 +650,7 @@ class MQTTPublisher:
         message = {
             'event': 'session_start',
             'session_id': session_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._now_iso(),
             'metadata': metadata
         }
         
@@ -352,7 +661,7 @@ class MQTTPublisher:
         message = {
             'event': 'session_end',
             'session_id': session_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._now_iso(),
             'statistics': statistics
         }
         
@@ -362,7 +671,7 @@ class MQTTPublisher:
         """Publish session metadata update"""
         message = {
             'session_id': session_id,
-            'timestamp': datetime.now().isoformat(),
+            'timestamp': self._now_iso(),
             'metadata': metadata
         }
         
@@ -378,73 +687,165 @@ class MQTTPublisher:
         """
         try:
             path = Path(file_path)
-            if not path.exists():
+            try:
+                file_stat = path.stat()
+            except FileNotFoundError:
                 # File deleted locally, notify server
                 self._publish_file_deletion(str(path))
                 return
             
+            # Cheap change filter: same mtime and size => unchanged, skip hashing
+            with self.sync_lock:
+                tracked = self.tracked_files.get(str(path))
+            if (tracked is not None
+                    and tracked.get('mtime_ns') == file_stat.st_mtime_ns
+                    and tracked['size'] == file_stat.st_size):
+                return
+            
             # Calculate file hash
             file_hash = self._calculate_file_hash(path)
-            file_stat = path.stat()
             
-            # Check if file changed
-            with self.sync_lock:
-                if str(path) in self.tracked_files:
-                    if self.tracked_files[str(path)]['hash'] == file_hash:
-                        # File unchanged
-                        return
-            
-            # Read file content
-            with open(path, 'r') as f:
-                content = f.read()
-            
-            # Prepare sync message
-            message = {
-                'action': 'file_update',
-                'file_path': str(path),
-                'file_type': file_type,
-                'file_name': path.name,
-                'content': content,
-                'hash': file_hash,
-                'size': file_stat.st_size,
-                'modified': file_stat.st_mtime,
-                'timestamp': datetime.now().isoformat(),
-                'client_id': self.client_id
-            }
+            # Check if file changed (touched but same content: just refresh mtime)
+            if tracked is not None and tracked['hash'] == file_hash:
+                with self.sync_lock:
+                    tracked['mtime_ns'] = file_stat.st_mtime_ns
+                return
             
-            # Publish
-            if self._publish_direct(self.topics['sync']['file_update'], message):
+            if file_stat.st_size > self.chunked_sync_threshold:
+                # Large file: stream it in fixed-size chunks
+                published = self._publish_file_chunks(path, file_type, file_hash, file_stat)
+            else:
+                # Prepare sync message
+                header = self._envelope_with({
+                    'action': 'file_update',
+                    'file_path': str(path),
+                    'file_type': file_type,
+                    'file_name': path.name,
+                    'hash': file_hash,
+                    'size': file_stat.st_size,
+                    'modified': file_stat.st_mtime
+                })
+                
+                if self.raw_file_sync:
+                    # Raw bytes, sent as-is after the header line
+                    with open(path, 'rb') as f:
+                        content = f.read()
+                    published = self._publish_direct(self.topics['sync']['file_update_raw'],
+                                                     self._header_payload(header, content))
+                else:
+                    # Legacy message: file text embedded in the JSON
+                    with open(path, 'r') as f:
+                        header['content'] = f.read()
+                    published = self._publish_direct(self.topics['sync']['file_update'], header)
+            
+            if published:
                 # Update tracking
                 with self.sync_lock:
-                    self.tracked_files[str(path)] = {
+                    self._track_file(str(path), {
                         'hash': file_hash,
                         'last_modified': file_stat.st_mtime,
+                        'mtime_ns': file_stat.st_mtime_ns,
                         'size': file_stat.st_size
-                    }
-                self.stats['files_synced'] += 1
+                    })
+                with self._stats_lock:  # sync_file runs on the sync_workers pool
+                    self.stats['files_synced'] += 1
                 print(f"[MQTT] File synced: {path.name}")
             
         except Exception as e:
             print(f"[MQTT] Error syncing file {file_path}: {e}")
     
+    @staticmethod
+    def _header_payload(header: Dict, content: bytes) -> bytes:
+        """
+        Payload for the file_update/raw topic: one line of compact JSON metadata,
+        b'\\n', then the file bytes unescaped (the receiver splits on the first
+        newline; compact JSON never contains a raw newline)
+        """
+        head = _dumps(header)
+        if isinstance(head, str):
+            head = head.encode('utf-8')
+        return b''.join((head, b'\n', content))
+    
+    def _publish_file_chunks(self, path: Path, file_type: str, file_hash: str, file_stat) -> bool:
+        """
+        Publish a large file as 'file_update_chunk' messages of sync_chunk_size bytes
+        ('chunk_id' of 'total_chunks'; base64 'data' on file_update, or with
+        raw_file_sync a header line then the raw chunk bytes on file_update/raw);
+        the receiver reassembles by chunk_id and checks the whole file against
+        'hash' (SHA-256, as file_update)
+        Returns True if every chunk was queued
+        """
+        raw = self.raw_file_sync
+        topic = self.topics['sync']['file_update_raw' if raw else 'file_update']
+        chunk_size = self.sync_chunk_size
+        total_chunks = max(1, -(-file_stat.st_size // chunk_size))
+        header = self._envelope_with({
+            'action': 'file_update_chunk',
+            'file_path': str(path),
+            'file_type': file_type,
+            'file_name': path.name,
+            'hash': file_hash,
+            'size': file_stat.st_size,
+            'modified': file_stat.st_mtime,
+            'total_chunks': total_chunks
+        })
+        
+        with open(path, 'rb') as f:
+            for chunk_id in range(total_chunks):
+                message = dict(header)
+                message['chunk_id'] = chunk_id
+                message['timestamp'] = self._now_iso()
+                if raw:
+                    payload = self._header_payload(message, f.read(chunk_size))
+                else:
+                    message['data'] = base64.b64encode(f.read(chunk_size)).decode('ascii')
+                    payload = message
+                if not self._publish_direct(topic, payload):
+                    return False
+        return True
+    
     def _publish_file_deletion(self, file_path: str):
         """Notify server about file deletion"""
-        message = {
+        message = self._envelope_with({
             'action': 'file_delete',
-            'file_path': file_path,
-            'timestamp': datetime.now().isoformat(),
-            'client_id': self.client_id
-        }
+            'file_path': file_path
+        })
         
         self._publish_direct(self.topics['sync']['file_delete'], message)
         
         # Remove from tracking
         with self.sync_lock:
-            if file_path in self.tracked_files:
-                del self.tracked_files[file_path]
+            self._untrack_file(file_path)
         
         print(f"[MQTT] File deletion synced: {file_path}")
     
+    def _track_file(self, file_path: str, info: Dict):
+        """Record a synced file and index it under every ancestor directory (sync_lock held)"""
+        self.tracked_files[file_path] = info
+        parent = os.path.dirname(file_path)
+        while parent:
+            self._tracked_by_prefix.setdefault(parent, set()).add(file_path)
+            up = os.path.dirname(parent)
+            if up == parent:
+                break
+            parent = up
+    
+    def _untrack_file(self, file_path: str):
+        """Forget a tracked file and drop it from the ancestor index (sync_lock held)"""
+        if self.tracked_files.pop(file_path, None) is None:
+            return
+        parent = os.path.dirname(file_path)
+        while parent:
+            below = self._tracked_by_prefix.get(parent)
+            if below is not None:
+                below.discard(file_path)
+                if not below:
+                    del self._tracked_by_prefix[parent]
+            up = os.path.dirname(parent)
+            if up == parent:
+                break
+            parent = up
+    
     def _sync_folder_structure(self):
         """Send complete folder structure to server"""
         try:
@@ -453,12 +854,10 @@ class MQTTPublisher:
                 'anomaly_logs': self._scan_directory('anomaly_logs')
             }
             
-            message = {
+            message = self._envelope_with({
                 'action': 'structure_sync',
-                'structure': structure,
-                'timestamp': datetime.now().isoformat(),
-                'client_id': self.client_id
-            }
+                'structure': structure
+            })
             
             self._publish_direct(self.topics['sync']['structure'], message)
             print("[MQTT] Folder structure synced")
@@ -467,7 +866,11 @@ class MQTTPublisher:
             print(f"[MQTT] Error syncing folder structure: {e}")
     
     def _scan_directory(self, base_path: str) -> Dict:
-        """Recursively scan directory structure"""
+        """
+        Scan directory structure (nested dict, one node per file/directory)
+        Iterative os.scandir walk: one directory listing per level and a
+        single stat per file, no recursion
+        """
         base = Path(base_path)
         if not base.exists():
             return {}
@@ -479,56 +882,141 @@ class MQTTPublisher:
             'children': {}
         }
         
-        try:
-            for item in base.iterdir():
-                if item.is_dir():
-                    structure['children'][item.name] = self._scan_directory(str(item))
-                else:
-                    structure['children'][item.name] = {
-                        'type': 'file',
-                        'name': item.name,
-                        'path': str(item),
-                        'size': item.stat().st_size,
-                        'modified': item.stat().st_mtime
-                    }
-        except Exception as e:
-            print(f"[MQTT] Error scanning {base}: {e}")
+        stack = [structure]
+        while stack:
+            node = stack.pop()
+            children = node['children']
+            try:
+                with os.scandir(node['path']) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            child = {
+                                'type': 'directory',
+                                'name': entry.name,
+                                'path': entry.path,
+                                'children': {}
+                            }
+                            stack.append(child)
+                        else:
+                            entry_stat = entry.stat()
+                            child = {
+                                'type': 'file',
+                                'name': entry.name,
+                                'path': entry.path,
+                                'size': entry_stat.st_size,
+                                'modified': entry_stat.st_mtime
+                            }
+                        children[entry.name] = child
+            except Exception as e:
+                print(f"[MQTT] Error scanning {node['path']}: {e}")
         
         return structure
     
     def _calculate_file_hash(self, file_path: Path) -> str:
         """Calculate SHA256 hash of file"""
-        sha256 = hashlib.sha256()
         with open(file_path, 'rb') as f:
-            for chunk in iter(lambda: f.read(4096), b''):
+            if hasattr(hashlib, 'file_digest'):
+                # Python 3.11+: whole read/hash loop in C (OpenSSL, SHA extensions if any)
+                return hashlib.file_digest(f, 'sha256').hexdigest()
+            
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: f.read(1 << 20), b''):
                 sha256.update(chunk)
         return sha256.hexdigest()
     
     def _start_sync_thread(self):
-        """Start background thread for periodic sync"""
+        """
+        Start background thread for file sync
+        With watchdog, files are synced as their change events arrive and a full
+        pass runs every reconcile_interval; without it, every sync_interval
+        """
         self._stop_sync.clear()
+        interval = self.sync_interval
+        
+        if Observer is not None:
+            observer = Observer()
+            handler = _SyncEventHandler(self._sync_changes)
+            watched = 0
+            for base in self.sync_dirs:
+                if os.path.isdir(base):
+                    observer.schedule(handler, base, recursive=True)
+                    watched += 1
+            if watched:
+                observer.start()
+                self._sync_observer = observer
+                interval = self.reconcile_interval
         
         def sync_loop():
+            next_pass = time.monotonic()  # full pass right away
             while not self._stop_sync.is_set():
-                if self.connected:
-                    try:
-                        # Sync data_storage files
-                        self._sync_all_files('data_storage')
-                        
-                        # Sync anomaly logs
-                        self._sync_all_files('anomaly_logs')
-                        
-                        self.stats['last_sync'] = datetime.now().isoformat()
-                        
-                    except Exception as e:
-                        print(f"[MQTT] Sync error: {e}")
+                try:
+                    path = self._sync_changes.get(timeout=max(0.0, next_pass - time.monotonic()))
+                except queue.Empty:
+                    path = None
+                if self._stop_sync.is_set():
+                    break
+                
+                if path is not None:
+                    self._sync_changed_files(path)
                 
-                # Wait for next sync interval
-                self._stop_sync.wait(self.sync_interval)
+                if time.monotonic() >= next_pass:
+                    if self.connected:
+                        try:
+                            for base in self.sync_dirs:
+                                self._sync_all_files(base)
+                            
+                            self.stats['last_sync'] = datetime.now().isoformat()
+                            
+                        except Exception as e:
+                            print(f"[MQTT] Sync error: {e}")
+                    
+                    next_pass = time.monotonic() + interval
         
         self._sync_thread = threading.Thread(target=sync_loop, daemon=True)
         self._sync_thread.start()
-        print(f"[MQTT] Sync thread started (interval: {self.sync_interval}s)")
+        mode = "event-driven" if self._sync_observer is not None else "polling"
+        print(f"[MQTT] Sync thread started ({mode}, full pass every {interval}s)")
+    
+    def _sync_changed_files(self, first_path: str):
+        """Sync the files behind a burst of watchdog events, once per path"""
+        # dict keeps first-seen order while dropping duplicates; a short quiet
+        # gap lets one write's created/modified/closed events collapse together,
+        # bounded by sync_batch_window / sync_batch_max
+        pending = {first_path: None}
+        deadline = time.monotonic() + self.sync_batch_window
+        while len(pending) < self.sync_batch_max:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                path = self._sync_changes.get(timeout=min(0.2, remaining))
+            except queue.Empty:
+                break
+            if path is None:
+                break
+            pending[path] = None
+        
+        if not self.connected:
+            return  # the next full pass picks these up
+        
+        for path in pending:
+            if not os.path.exists(path):
+                with self.sync_lock:
+                    if path not in self.tracked_files:
+                        continue  # never synced (e.g. temp file): nothing to delete
+            try:
+                self.sync_file(path, self._file_type(path))
+            except Exception as e:
+                print(f"[MQTT] Sync error: {e}")
+    
+    @staticmethod
+    def _file_type(file_path: str) -> str:
+        """'metadata', 'anomaly' or 'data', from the file path"""
+        if 'metadata.json' in os.path.basename(file_path):
+            return 'metadata'
+        elif 'anomalies' in file_path:
+            return 'anomaly'
+        return 'data'
     
     def _sync_all_files(self, base_path: str):
         """Sync all files in a directory"""
@@ -539,27 +1027,36 @@ class MQTTPublisher:
         # Track current files
         current_files = set()
         
-        for file_path in base.rglob('*'):
-            if file_path.is_file():
-                current_files.add(str(file_path))
-                
-                # Determine file type
-                if 'metadata.json' in file_path.name:
-                    file_type = 'metadata'
-                elif 'anomalies' in str(file_path):
-                    file_type = 'anomaly'
-                else:
-                    file_type = 'data'
-                
-                self.sync_file(str(file_path), file_type)
+        # Iterative os.scandir walk instead of rglob: no Path object and no
+        # extra stat per entry
+        stack = [str(base)]
+        while stack:
+            try:
+                with os.scandir(stack.pop()) as entries:
+                    for entry in entries:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            current_files.add(entry.path)
+            except OSError as e:
+                print(f"[MQTT] Error scanning {base}: {e}")
         
-        # Check for deleted files
+        def sync_one(file_path):
+            self.sync_file(file_path, self._file_type(file_path))
+        
+        # Overlap per-file stat/read/hash/publish: the pass is I/O-bound, and
+        # hashing and file reads release the GIL
+        with ThreadPoolExecutor(max_workers=self.sync_workers,
+                                thread_name_prefix="mqtt-sync") as pool:
+            for _ in pool.map(sync_one, current_files):
+                pass
+        
+        # Check for deleted files (publish outside the lock: it takes sync_lock itself)
         with self.sync_lock:
-            tracked_in_base = {f for f in self.tracked_files.keys() if f.startswith(str(base))}
-            deleted_files = tracked_in_base - current_files
-            
-            for deleted_file in deleted_files:
-                self._publish_file_deletion(deleted_file)
+            deleted_files = self._tracked_by_prefix.get(str(base), set()) - current_files
+        
+        for deleted_file in deleted_files:
+            self._publish_file_deletion(deleted_file)
     
     def publish_cleanup_event(self, deleted_items: List[str]):
         """
@@ -568,70 +1065,155 @@ class MQTTPublisher:
         Args:
             deleted_items: List of paths that were deleted
         """
-        message = {
+        message = self._envelope_with({
             'action': 'cleanup',
-            'deleted_items': deleted_items,
-            'timestamp': datetime.now().isoformat(),
-            'client_id': self.client_id
-        }
+            'deleted_items': deleted_items
+        })
         
         self._publish_direct(self.topics['sync']['cleanup'], message)
         
         # Remove from tracking
         with self.sync_lock:
             for item in deleted_items:
-                # Remove exact path and all subpaths
-                to_remove = [k for k in self.tracked_files.keys() if k.startswith(item)]
+                # Remove exact path and all subpaths (ancestor index, no scan)
+                item = os.path.normpath(item)
+                to_remove = list(self._tracked_by_prefix.get(item, ()))
+                if item in self.tracked_files:
+                    to_remove.append(item)
                 for k in to_remove:
-                    del self.tracked_files[k]
+                    self._untrack_file(k)
         
         print(f"[MQTT] Cleanup synced: {len(deleted_items)} items")
     
     def _add_to_buffer(self, topic, data):
-        """Add message to publishing buffer"""
-        with self.buffer_lock:
-            self.publish_buffer.append((topic, data))
+        """
+        Add message to its class publishing buffer, with an overload policy:
+        - realtime: new messages are dropped once the buffer is 95% full
+          (stale frames are worthless; don't let them evict fresher ones)
+        - anomaly: the oldest is dropped only past max_anomaly_buffer_size,
+          with a warning
+        - storage/sync: the oldest message is dropped when full
+        """
+        buffer = self._topic_buffer.get(topic) or self.publish_buffers['sync']
+        size = buffer.qsize()
+        if buffer is self.publish_buffers['anomaly']:
+            if size >= self.max_anomaly_buffer_size:
+                self._evict_oldest(buffer, 'anomalies_evicted')
+                evicted = self.stats['anomalies_evicted']
+                if evicted % 1000 == 1:
+                    print(f"[MQTT] Anomaly buffer full ({size} queued), "
+                          f"dropped {evicted} oldest anomalies so far")
+        elif size >= self.max_buffer_size * 0.95:
+            if buffer is self.publish_buffers['realtime']:
+                self._count_drop('realtime_shed')
+                return
+            if size >= self.max_buffer_size:
+                self._evict_oldest(buffer, 'buffer_evicted')
+        buffer.put((topic, data))
+    
+    def _evict_oldest(self, buffer, kind):
+        """Drop the oldest message of a full buffer, counting it as kind"""
+        try:
+            buffer.get_nowait()
+        except queue.Empty:
+            return
+        self._count_drop(kind)
+    
+    def _count_drop(self, kind):
+        """Count a dropped message under its kind and in messages_dropped"""
+        with self._stats_lock:
+            self.stats[kind] += 1
+            self.stats['messages_dropped'] += 1
     
     def _start_buffer_thread(self):
-        """Start background thread for processing buffer"""
+        """Start one background thread per publishing buffer"""
         self._stop_buffer.clear()
         
-        def buffer_loop():
-            while not self._stop_buffer.is_set():
-                if not self.connected:
-                    time.sleep(0.5)
-                    continue
-                
-                # Process buffer
-                with self.buffer_lock:
-                    if len(self.publish_buffer) == 0:
-                        time.sleep(0.01)
-                        continue
+        for name, buffer in self.publish_buffers.items():
+            qos = self.realtime_qos if name == 'realtime' else self.qos
+            batch_size = 10 if name == 'realtime' else 100
+            thread = threading.Thread(
+                target=self._buffer_loop,
+                args=(buffer, qos, batch_size),
+                name=f"mqtt-{name}",
+                daemon=True
+            )
+            thread.start()
+            self._pin_thread(thread, 'buffer')
+            self._buffer_threads.append(thread)
+    
+    def _pin_thread(self, thread, role):
+        """Restrict a started thread to the CPUs configured in thread_cpus[role], if any"""
+        cpus = self.thread_cpus.get(role)
+        if not cpus or thread is None or not hasattr(os, 'sched_setaffinity'):
+            return
+        try:
+            os.sched_setaffinity(thread.native_id, cpus)
+        except (OSError, AttributeError) as e:
+            print(f"[MQTT] Could not pin {thread.name} to CPUs {cpus}: {e}")
+    
+    def _buffer_loop(self, buffer, qos, batch_size):
+        """Publish messages of one buffer until _stop_buffer is set"""
+        pending = {}  # topic -> coalesced frames being collected (see _merge_frames)
+        
+        while not self._stop_buffer.is_set():
+            if not self.connected:
+                time.sleep(0.5)
+                continue
+            
+            # Block until something arrives (put() wakes us immediately);
+            # while frames are being coalesced, wake again when the oldest window ends
+            if pending:
+                oldest = min(entry['opened'] for entry in pending.values())
+                timeout = max(0.0, oldest + self.coalesce_window - time.monotonic())
+            else:
+                timeout = 0.5
+            
+            # Take up to batch_size items: messages are published as they are,
+            # frame chunks are merged into the pending per-topic messages
+            messages = []
+            try:
+                item = buffer.get(timeout=timeout)
+                taken = 1
+                while True:
+                    topic, data = item
+                    if isinstance(data, tuple):
+                        message = self._merge_frames(pending, topic, data)
+                        if message is not None:
+                            messages.append(message)
+                    else:
+                        messages.append(item)
+                    if taken == batch_size:
+                        break
+                    item = buffer.get_nowait()
+                    taken += 1
+            except queue.Empty:
+                pass
+            
+            # Release coalesced frame batches whose window has elapsed
+            if pending:
+                deadline = time.monotonic() - self.coalesce_window
+                for topic in [t for t, entry in pending.items() if entry['opened'] <= deadline]:
+                    messages.append(self._coalesced_message(topic, pending.pop(topic)))
+            
+            # Publish batch
+            for topic, data in messages:
+                try:
+                    pub_topic, payload = self._compress(topic, _dumps(data))
+                    nbytes = len(payload)
+                    if qos == 0:
+                        result = self._publish_aliased(pub_topic, payload)
+                    else:
+                        result = self.client.publish(pub_topic, payload, qos=qos)
                     
-                    batch_size = min(100, len(self.publish_buffer))
-                    messages = [self.publish_buffer.popleft() 
-                               for _ in range(batch_size)]
-                
-                # Publish batch
-                for topic, data in messages:
-                    try:
-                        payload = json.dumps(data)
-                        result = self.client.publish(topic, payload, qos=self.qos)
-                        
-                        if result.rc == mqtt.MQTT_ERR_SUCCESS:
-                            self.stats['bytes_sent'] += len(payload)
-                        else:
-                            self.stats['messages_failed'] += 1
-                            with self.buffer_lock:
-                                self.publish_buffer.append((topic, data))
-                    except Exception as e:
-                        print(f"[MQTT] Buffer publish error: {e}")
+                    if result.rc == mqtt.MQTT_ERR_SUCCESS:
+                        self._count_bytes(nbytes)
+                    else:
                         self.stats['messages_failed'] += 1
-                
-                time.sleep(0.001)
-        
-        self._buffer_thread = threading.Thread(target=buffer_loop, daemon=True)
-        self._buffer_thread.start()
+                        self._add_to_buffer(topic, data)
+                except Exception as e:
+                    print(f"[MQTT] Buffer publish error: {e}")
+                    self.stats['messages_failed'] += 1
     
     def sync_data_file_incremental(self, file_path: str, signal_type: str):
         """
@@ -639,34 +1221,62 @@ class MQTTPublisher:
         Used by file watcher for automatic synchronization
         """
         try:
-            from pathlib import Path
-            import json
+            # Get last read position (keyed by path string)
+            last_pos = self._file_positions.get(file_path, 0)
             
-            file_path = Path(file_path)
+            try:
+                file_stat = os.stat(file_path)
+            except FileNotFoundError:
+                self._close_file_handle(file_path)
+                return
+            
+            # File replaced under the same name (rotation): reopen from the start
+            f = self._file_handles.get(file_path)
+            if f is not None and os.fstat(f.fileno()).st_ino != file_stat.st_ino:
+                self._close_file_handle(file_path)
+                f = None
+                last_pos = 0
             
-            # Track last position for each file
-            if not hasattr(self, '_file_positions'):
-                self._file_positions = {}
+            # Skip files that haven't grown (e.g. events fired by metadata rewrites)
+            file_size = file_stat.st_size
+            if file_size == last_pos:
+                return
+            if file_size < last_pos:
+                # File truncated: start over
+                last_pos = 0
             
-            # Get last read position
-            last_pos = self._file_positions.get(str(file_path), 0)
+            # Keep the reader open across syncs: no open/close per event
+            if f is None:
+                f = self._open_file_handle(file_path)
             
-            # Read only new lines
-            with open(file_path, 'r') as f:
+            # Read only new bytes (no text decoding, json.loads accepts bytes)
+            if f.tell() != last_pos:
                 f.seek(last_pos)
-                new_lines = f.readlines()
-                new_pos = f.tell()
+            if hasattr(os, 'posix_fadvise'):
+                # Prime readahead over the new tail only
+                os.posix_fadvise(f.fileno(), last_pos, file_size - last_pos,
+                                 os.POSIX_FADV_SEQUENTIAL)
+            buf = f.read()
+            
+            new_lines = buf.split(b'\n')
+            # Last element is a partial line (or empty if buf ends with newline):
+            # leave it in the file so the next sync re-reads it once completed
+            partial = new_lines.pop()
+            new_pos = last_pos + len(buf) - len(partial)
             
             if not new_lines:
-                return  # No new data
+                return  # No complete new line yet
             
-            # Update position
-            self._file_positions[str(file_path)] = new_pos
+            # Update position and extend the running hash with the consumed bytes only
+            self._file_positions[file_path] = new_pos
+            hasher = self._hash_state.get(file_path) if last_pos else None
+            if hasher is None:
+                hasher = self._hash_state[file_path] = hashlib.sha256()
+            hasher.update(memoryview(buf)[:new_pos - last_pos])
             
             # Parse and send new data
             batch = []
             for line in new_lines:
-                line = line.strip()
                 if line:
                     try:
                         data = json.loads(line)
@@ -676,24 +1286,52 @@ class MQTTPublisher:
             
             if batch:
                 # Send batch
-                topic = self.topics['storage'][signal_type]
+                topic = self._storage_topic[signal_type]
                 payload = {
-                    'session_id': file_path.parent.name,
+                    'session_id': os.path.basename(os.path.dirname(file_path)),
                     'signal': signal_type,
                     'data': batch,
+                    'hash': hasher.hexdigest(),  # sha256 of the file up to the synced offset
                     'timestamp': time.time()
                 }
                 
+                if self.payload_format == "msgpack":
+                    payload = msgpack.packb(payload, use_bin_type=True)
+                
                 self._publish_direct(topic, payload)
                 print(f"[MQTT Sync] Sent {len(batch)} new samples for {signal_type}")
         
         except Exception as e:
             print(f"[MQTT Sync] Error in incremental sync: {e}")
     
+    def _open_file_handle(self, file_path: str):
+        """Open a persistent reader, closing the least recently opened one if at the limit"""
+        while len(self._file_handles) >= self.max_file_handles:
+            oldest = next(iter(self._file_handles))
+            self._close_file_handle(oldest)
+        
+        f = open(file_path, 'rb')
+        self._file_handles[file_path] = f
+        return f
+    
+    def _close_file_handle(self, file_path: str):
+        """Close the persistent reader of a file, if any"""
+        f = self._file_handles.pop(file_path, None)
+        if f is not None:
+            f.close()
+    
+    def _close_file_handles(self):
+        """Close all persistent readers"""
+        for file_path in list(self._file_handles):
+            self._close_file_handle(file_path)
+    
     def sync_anomaly_file(self, file_path: str, anomaly_type: str):
         """
         Sync entire anomaly file (supports both .json array and .jsonl formats)
         Used by file watcher for automatic synchronization
+        
+        Anomalies are parsed and published in batches of 10 in a single
+        pass, without building the full list first
         """
         try:
             from pathlib import Path
@@ -704,52 +1342,78 @@ class MQTTPublisher:
             if not file_path.exists():
                 return
             
-            anomalies = []
-            
             # Check file format
             if file_path.suffix == '.jsonl':
                 # JSON Lines format - one JSON per line
-                with open(file_path, 'r') as f:
-                    for line in f:
-                        line = line.strip()
+                with open(file_path, 'rb') as f:
+                    lines = f.read().split(b'\n')
+                
+                # Counting lines is far cheaper than parsing them
+                total_anomalies = sum(1 for line in lines if line)
+                
+                def iter_anomalies():
+                    for line in lines:
                         if line:
                             try:
-                                anomaly = json.loads(line)
-                                anomalies.append(anomaly)
+                                yield json.loads(line)
                             except:
                                 continue
+                
+                anomalies = iter_anomalies()
             else:
                 # Regular .json format - array of objects
                 try:
                     with open(file_path, 'r') as f:
                         data = json.load(f)
-                        if isinstance(data, list):
-                            anomalies = data
-                        elif isinstance(data, dict):
-                            anomalies = [data]
                 except json.JSONDecodeError:
                     print(f"[MQTT Sync] Invalid JSON in {file_path}")
                     return
-            
-            if anomalies:
-                # Send all anomalies in batches of 10
-                topic = self.topics['anomalies'][anomaly_type.upper()]
-                
-                for i in range(0, len(anomalies), 10):
-                    batch = anomalies[i:i+10]
-                    payload = {
-                        'anomaly_type': anomaly_type,
-                        'file_name': file_path.name,  # Add filename for receiver
-                        'anomalies': batch,
-                        'timestamp': time.time(),
-                        'batch': i // 10,
-                        'total_anomalies': len(anomalies)
-                    }
-                    
-                    self._publish_direct(topic, payload)
-                    time.sleep(0.05)  # Small delay between batches
                 
-                print(f"[MQTT Sync] Sent {len(anomalies)} anomalies for {anomaly_type}")
+                if isinstance(data, list):
+                    anomalies = data
+                elif isinstance(data, dict):
+                    anomalies = [data]
+                else:
+                    anomalies = []
+                total_anomalies = len(anomalies)
+            
+            if not total_anomalies:
+                return
+            
+            # Send all anomalies in batches of 10, back-to-back:
+            # paho's inflight window paces the broker instead of fixed sleeps
+            emit = self._anomaly_emitters[anomaly_type]
+            file_name = file_path.name
+            infos = []
+            sent = 0
+            batch = []
+            batch_idx = 0
+            
+            for anomaly in anomalies:
+                batch.append(anomaly)
+                sent += 1
+                if len(batch) == 10:
+                    infos.append(emit(file_name, batch, batch_idx, total_anomalies))
+                    batch = []
+                    batch_idx += 1
+            
+            if batch:
+                infos.append(emit(file_name, batch, batch_idx, total_anomalies))
+            
+            # Wait for broker acks (nothing to wait for with QoS 0), all within
+            # one shared 5 s deadline rather than 5 s per batch; stop at the
+            # first batch still unacked when it runs out
+            if self.qos > 0:
+                deadline = time.monotonic() + 5
+                for info in infos:
+                    if info is None:
+                        continue
+                    info.wait_for_publish(timeout=max(0.0, deadline - time.monotonic()))
+                    if not info.is_published():
+                        print(f"[MQTT Sync] Timed out waiting for acks of {anomaly_type} anomalies")
+                        break
+            
+            print(f"[MQTT Sync] Sent {sent} anomalies for {anomaly_type}")
         
         except Exception as e:
             print(f"[MQTT Sync] Error syncing anomalies: {e}")
@@ -760,10 +1424,14 @@ class MQTTPublisher:
             'connected': self.connected,
             'messages_sent': self.stats['messages_sent'],
             'messages_failed': self.stats['messages_failed'],
+            'messages_dropped': self.stats['messages_dropped'],
+            'realtime_shed': self.stats['realtime_shed'],
+            'buffer_evicted': self.stats['buffer_evicted'],
+            'anomalies_evicted': self.stats['anomalies_evicted'],
             'bytes_sent': self.stats['bytes_sent'],
             'anomalies_sent': self.stats['anomalies_sent'],
             'files_synced': self.stats['files_synced'],
-            'buffer_size': len(self.publish_buffer),
+            'buffer_size': sum(b.qsize() for b in self.publish_buffers.values()),
             'tracked_files': len(self.tracked_files),
             'last_publish': self.stats['last_publish'],
             'last_sync': self.stats['last_sync']
@@ -773,9 +1441,13 @@ class MQTTPublisher:
 # Singleton instance
 _mqtt_instance = None
 
-def get_mqtt_publisher(broker, port=1883, username=None, password=None):
+def get_mqtt_publisher(broker, port=1883, username=None, password=None,
+                       payload_format="json", compression=None, mqtt_v5=False):
     """Get the global MQTT publisher instance"""
     global _mqtt_instance
     if _mqtt_instance is None:
-        _mqtt_instance = MQTTPublisher(broker, port, username, password)
+        _mqtt_instance = MQTTPublisher(broker, port, username, password,
+                                       payload_format=payload_format,
+                                       compression=compression,
+                                       mqtt_v5=mqtt_v5)
     return _mqtt_instance
\ No newline at end of file
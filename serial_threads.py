@@ -1,8 +1,51 @@
-from serial.threaded import LineReader, Protocol
+from serial.threaded import LineReader, Packetizer, Protocol
+import logging
 import threading
 from handler_data   import DataRawReader
 
-class ShellLineReader(LineReader):
+# Per-line debug output goes through logging: disabled, log.debug returns
+# before formatting anything (no f-string, no stdout write per serial line)
+log = logging.getLogger(__name__)
+
+
+def _command_flag(handler_name):
+    """Pending-command flag that (un)binds its line handler when assigned"""
+    attr = "_" + handler_name
+
+    def get(self):
+        return self.__dict__.get(attr, False)
+
+    def set(self, value):
+        self.__dict__[attr] = value
+        handler = getattr(self, handler_name)
+        if value:
+            self._active_handler = handler
+        elif self._active_handler == handler:
+            self._active_handler = self._noop
+
+    return property(get, set)
+
+
+class ShellLineReader(Packetizer):
+    # Lines stay bytes: the sentinels below are ASCII, so matching them needs
+    # no decode; a line is only decoded when handed to on_line_callback
+    TERMINATOR = b'\r\n'
+    ENCODING = 'utf-8'
+    UNICODE_HANDLING = 'replace'
+    SHELL = b"shell"
+    CONNECTED = b">CONNECTED"
+    DISCONNECTED = b">DISCONNECTED"
+    OK = b"OK"
+    DONE = b"DONE"
+    OUT_MODE_HDR = b"out mode: (hdr)"
+
+    # send_ack() raises one of these before writing a command; the matching
+    # _handle_* becomes the only check run on each line until it is answered
+    initcommand = _command_flag("_handle_init")
+    startcommand = _command_flag("_handle_start")
+    stopcommand = _command_flag("_handle_stop")
+    outconfigcommand = _command_flag("_handle_outconfig")
+
     def __init__(self, on_line_callback, on_validated_callback, on_disconnected_callback,on_device_disconnect_callback):
         super().__init__()
 
@@ -10,55 +53,78 @@ class ShellLineReader(LineReader):
         self.on_validated_callback = on_validated_callback
         self.on_disconnected = on_disconnected_callback #when serial fails
         self.on_device_disconnected=on_device_disconnect_callback #when the shell port device is disconnected
-        self.response_event = threading.Event()
+        # Responses bump response_gen under response_cond; a caller notes the
+        # generation before sending a command and waits for it to change
+        self.response_cond = threading.Condition()
+        self.response_gen = 0
 
         self.validated = False  
         self.connected_to_device=False
+        self._active_handler = self._noop
         self.initcommand=False
         self.startcommand=False
         self.stopcommand=False
         self.outconfigcommand=False
-        self.start_responses = []
+        self.start_responses = set()  # b"<MODULE> OK" lines still expected after START
 
 
 
-    def handle_line(self, line):
-        line = line.strip()
-        self.on_line_callback(line)
+    def handle_packet(self, packet):
+        line = packet.strip()
+        if self.on_line_callback is not None:
+            self.on_line_callback(line.decode(self.ENCODING, self.UNICODE_HANDLING))
 
-        if not self.validated and "shell" in line.lower():
+        if not self.validated and self.SHELL in line.lower():
             self.validated = True
-            print(f"[DEBUG] From Shell Received...{line}")
+            log.debug("From Shell Received...%s", line)
             self.on_validated_callback()
 
-        elif not self.connected_to_device and ">CONNECTED"==line:
+        elif not self.connected_to_device and line == self.CONNECTED:
             self.connected_to_device=True
-            print(f"[DEBUG] CONNECTEDDDDD")
-            self.response_event.set()
+            log.debug("CONNECTED")
+            self._notify_response()
 
-        elif self.connected_to_device and ">DISCONNECTED"==line:
+        elif self.connected_to_device and line == self.DISCONNECTED:
             self.connected_to_device=False
-            print(f"[DEBUG] DISCONNECTEDDDDD")
+            log.debug("DISCONNECTED")
             self.on_device_disconnected() 
 
-        elif self.connected_to_device and self.initcommand and "OK" in line:
+        elif self.connected_to_device:
+            self._active_handler(line)
+
+    def _noop(self, line):
+        pass
+
+    def _handle_init(self, line):
+        if self.OK in line:
             self.initcommand=False
-            self.response_event.set()
-
-        elif self.connected_to_device and self.startcommand:
-            self.start_responses = list(filter(lambda k: k not in line, self.start_responses))
-            if not self.start_responses:
-                self.startcommand=False
-                self.response_event.set()
-        elif self.connected_to_device and self.stopcommand and "DONE" in line:
-            self.stopcommand=False
-            self.response_event.set()
+            self._notify_response()
 
+    def _handle_start(self, line):
+        self.start_responses -= {k for k in self.start_responses if k in line}
+        if not self.start_responses:
+            self.startcommand=False
+            self._notify_response()
 
-        elif self.connected_to_device and self.outconfigcommand and "out mode: (hdr)" in line:
+    def _handle_stop(self, line):
+        if self.DONE in line:
+            self.stopcommand=False
+            self._notify_response()
+
+    def _handle_outconfig(self, line):
+        if self.OUT_MODE_HDR in line:
             self.outconfigcommand=False
-            self.response_event.set()
+            self._notify_response()
+
+    def _notify_response(self):
+        with self.response_cond:
+            self.response_gen += 1
+            self.response_cond.notify_all()
 
+    def wait_response(self, last_gen, timeout):
+        """Wait until a response arrives after generation last_gen; False on timeout"""
+        with self.response_cond:
+            return self.response_cond.wait_for(lambda: self.response_gen != last_gen, timeout=timeout)
 
     def handle_exception(self, exc_type, exc_val, exc_tb):
         # Called if serial fails
@@ -75,19 +141,19 @@ class DataLineReader(LineReader):
 
     def handle_line(self, line):
         line = line.strip()
-        print(f"[DEBUG] From Data Received...{line}")
+        log.debug("From Data Received...%s", line)
         self.on_line_callback(line)
 
         # Check for validation condition
         if not self.validated and "data" in line.lower(): 
             self.validated = True
-            print(f"[DEBUG] From Data Received...{line}")
+            log.debug("Data port validated: %s", line)
             self.on_validated_callback()
             
 
     def handle_exception(self, exc_type, exc_val, exc_tb):
         # Called if serial fails
-        print(f"[DEBUG] From Data Received...{exc_type} {exc_val} {exc_tb}")
+        log.debug("Data port error: %s %s", exc_type, exc_val)
         self.on_disconnected()        
 
 
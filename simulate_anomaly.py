@@ -3,11 +3,88 @@
 Simulate Anomaly - Generate synthetic anomalies for testing
 """
 
+import io
 import json
 import numpy as np
+from functools import lru_cache
 from pathlib import Path
 from datetime import datetime
 
+from temp_anomaly_detector import log_lock, temperature_severity
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+if orjson is not None:
+    # numpy scalars (e.g. reconstruction_error) serialize like floats
+    def _dumps(data):
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+else:
+    def _dumps(data):
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+# Log file name prefixes, shared with the detectors and the dashboard
+_LOG_PREFIXES = {
+    'ecg': 'anomalies_',
+    'piezo': 'piezo_anomalies_',
+    'temp': 'temp_anomalies_'
+}
+
+
+@lru_cache(maxsize=8)
+def _ecg_template(num_points):
+    """
+    Noise-free P-QRS-T waveform of num_points samples (read-only, shared
+    by every call with the same size)
+    """
+    # Normalized positions (0 to 1), one array op per segment
+    pos = np.arange(num_points) / num_points
+    
+    # Baseline
+    baseline = 100
+    
+    # Segments in priority order (first match wins, as an if/elif chain)
+    values = np.select(
+        [
+            (pos > 0.1) & (pos < 0.2),    # P wave (small bump at start)
+            (pos > 0.35) & (pos < 0.4),   # QRS: Q dip
+            (pos > 0.4) & (pos < 0.45),   # QRS: R peak
+            (pos > 0.45) & (pos < 0.5),   # QRS: S dip
+            (pos > 0.35) & (pos < 0.55),  # QRS: return to baseline
+            (pos > 0.6) & (pos < 0.8),    # T wave (broader bump after QRS)
+        ],
+        [
+            baseline + 10 * np.sin((pos - 0.1) * np.pi / 0.1),
+            baseline - 20,
+            baseline + 280 * ((pos - 0.4) / 0.05),
+            baseline - 20,
+            baseline + 40 * (1 - (pos - 0.5) / 0.05),
+            baseline + 30 * np.sin((pos - 0.6) * np.pi / 0.2),
+        ],
+        default=baseline
+    )
+    values.flags.writeable = False
+    return values
+
+
+@lru_cache(maxsize=8)
+def _piezo_template(num_points):
+    """Noise-free pressure wave of num_points samples (read-only, shared)"""
+    pos = np.arange(num_points) / num_points
+    
+    baseline = 450
+    
+    # Main pressure wave (asymmetric bell curve): fast rise, slower fall
+    active = (pos > 0.1) & (pos < 0.6)
+    amplitude = np.where(pos < 0.3,
+                         ((pos - 0.1) / 0.2) ** 2,
+                         1 - (np.abs(pos - 0.3) / 0.3) ** 1.5)
+    values = np.where(active, baseline + 1100 * amplitude, float(baseline))
+    values.flags.writeable = False
+    return values
+
 
 class AnomalySimulator:
     """Generate synthetic anomalies for ECG, PIEZO, and TEMP"""
@@ -15,76 +92,35 @@ class AnomalySimulator:
     def __init__(self, anomaly_logs_dir="anomaly_logs"):
         self.anomaly_logs_dir = Path(anomaly_logs_dir)
         self.anomaly_logs_dir.mkdir(exist_ok=True)
+        self._rng = np.random.default_rng()
+        self._noise = np.empty(128, dtype=np.float64)  # reused, grown on demand
+    
+    def _noisy(self, template, sigma):
+        """template + N(0, sigma) noise, built in the reused noise buffer"""
+        num_points = template.size
+        if self._noise.size < num_points:
+            self._noise = np.empty(num_points, dtype=np.float64)
+        buf = self._noise[:num_points]
+        self._rng.standard_normal(out=buf)
+        buf *= sigma
+        buf += template
+        return buf.astype(np.int32).tolist()
     
     def generate_ecg_sample_data(self, num_points=100):
         """
         Generate realistic ECG-like waveform data
         Simulates P-QRS-T complex pattern
         """
-        sample_data = []
-        
-        # Baseline
-        baseline = 100
-        
-        for i in range(num_points):
-            # Normalize position (0 to 1)
-            pos = i / num_points
-            
-            # P wave (small bump at start)
-            if 0.1 < pos < 0.2:
-                value = baseline + 10 * np.sin((pos - 0.1) * np.pi / 0.1)
-            # QRS complex (sharp spike in middle)
-            elif 0.35 < pos < 0.55:
-                if 0.35 < pos < 0.4:  # Q dip
-                    value = baseline - 20
-                elif 0.4 < pos < 0.45:  # R peak
-                    value = baseline + 280 * ((pos - 0.4) / 0.05)
-                elif 0.45 < pos < 0.5:  # S dip
-                    value = baseline - 20
-                else:  # Return to baseline
-                    value = baseline + 40 * (1 - (pos - 0.5) / 0.05)
-            # T wave (broader bump after QRS)
-            elif 0.6 < pos < 0.8:
-                value = baseline + 30 * np.sin((pos - 0.6) * np.pi / 0.2)
-            else:
-                value = baseline
-            
-            # Add small random noise
-            value += np.random.normal(0, 2)
-            sample_data.append(int(value))
-        
-        return sample_data
+        # Cached noise-free waveform + small random noise
+        return self._noisy(_ecg_template(num_points), 2)
     
     def generate_piezo_sample_data(self, num_points=100):
         """
         Generate realistic PIEZO sensor data
         Simulates pressure wave pattern
         """
-        sample_data = []
-        
-        baseline = 450
-        
-        for i in range(num_points):
-            pos = i / num_points
-            
-            # Main pressure wave (asymmetric bell curve)
-            if 0.1 < pos < 0.6:
-                # Rise (fast)
-                if pos < 0.3:
-                    amplitude = ((pos - 0.1) / 0.2) ** 2
-                    value = baseline + 1100 * amplitude
-                # Fall (slower)
-                else:
-                    amplitude = 1 - ((pos - 0.3) / 0.3) ** 1.5
-                    value = baseline + 1100 * amplitude
-            else:
-                value = baseline
-            
-            # Add noise
-            value += np.random.normal(0, 5)
-            sample_data.append(int(value))
-        
-        return sample_data
+        # Cached noise-free waveform + noise
+        return self._noisy(_piezo_template(num_points), 5)
     
     def calculate_severity(self, anomaly_type, temperature):
         """
@@ -97,20 +133,8 @@ class AnomalySimulator:
         Returns:
             str: 'mild', 'moderate', or 'severe'
         """
-        if anomaly_type == "hypothermia":
-            if temperature < 32.0:
-                return "severe"
-            elif temperature < 34.0:
-                return "moderate"
-            else:
-                return "mild"
-        else:  # hyperthermia
-            if temperature > 40.0:
-                return "severe"
-            elif temperature > 39.0:
-                return "moderate"
-            else:
-                return "mild"
+        # Same bands as the live detector
+        return temperature_severity(temperature, anomaly_type)
     
     def simulate_ecg_anomaly(self, reconstruction_error=None, threshold=0.1):
         """
@@ -123,7 +147,7 @@ class AnomalySimulator:
         Returns:
             dict: Anomaly data
         """
-        now = datetime.now()
+        iso = datetime.now().isoformat(timespec='microseconds')
         
         # Generate reconstruction error if not provided
         if reconstruction_error is None:
@@ -131,9 +155,9 @@ class AnomalySimulator:
             reconstruction_error = threshold + np.random.uniform(0, threshold)
         
         anomaly = {
-            "timestamp": now.isoformat(),
-            "date": now.strftime("%Y-%m-%d"),
-            "time": now.strftime("%H:%M:%S.%f")[:-3],
+            "timestamp": iso,
+            "date": iso[:10],
+            "time": iso[11:23],
             "reconstruction_error": round(reconstruction_error, 4),
             "threshold": threshold,
             "sample_data": self.generate_ecg_sample_data()
@@ -152,16 +176,16 @@ class AnomalySimulator:
         Returns:
             dict: Anomaly data
         """
-        now = datetime.now()
+        iso = datetime.now().isoformat(timespec='microseconds')
         
         # Generate reconstruction error if not provided
         if reconstruction_error is None:
             reconstruction_error = threshold + np.random.uniform(0, threshold)
         
         anomaly = {
-            "timestamp": now.isoformat(),
-            "date": now.strftime("%Y-%m-%d"),
-            "time": now.strftime("%H:%M:%S.%f")[:-3],
+            "timestamp": iso,
+            "date": iso[:10],
+            "time": iso[11:23],
             "reconstruction_error": round(reconstruction_error, 4),
             "threshold": threshold,
             "sensor": "PIEZO",
@@ -185,16 +209,16 @@ class AnomalySimulator:
         Returns:
             dict: Anomaly data
         """
-        now = datetime.now()
+        iso = datetime.now().isoformat(timespec='microseconds')
         
         # Calculate severity if not provided
         if severity is None:
             severity = self.calculate_severity(anomaly_type, temperature)
         
         anomaly = {
-            "timestamp": now.isoformat(),
-            "date": now.strftime("%Y-%m-%d"),
-            "time": now.strftime("%H:%M:%S"),
+            "timestamp": iso,
+            "date": iso[:10],
+            "time": iso[11:19],
             "anomaly_type": anomaly_type,
             "temperature": round(temperature, 2),
             "threshold": threshold,
@@ -204,9 +228,16 @@ class AnomalySimulator:
         
         return anomaly
     
+    def _log_path(self, anomaly_type, date, suffix):
+        """anomaly_logs/<prefix><date><suffix> for 'ecg', 'piezo' or 'temp'"""
+        if anomaly_type not in _LOG_PREFIXES:
+            raise ValueError(f"Invalid anomaly type: {anomaly_type}")
+        return self.anomaly_logs_dir / f"{_LOG_PREFIXES[anomaly_type]}{date}{suffix}"
+    
     def save_anomaly(self, anomaly_type, anomaly_data):
         """
-        Save anomaly to appropriate JSON file
+        Append anomaly to the day's log, in the format its detector writes:
+        JSON array for ECG/PIEZO, JSON Lines for TEMP
         
         Args:
             anomaly_type: 'ecg', 'piezo', or 'temp'
@@ -216,35 +247,95 @@ class AnomalySimulator:
             bool: True if successful
         """
         today = datetime.now().strftime("%Y%m%d")
+        record = _dumps(anomaly_data)
         
-        # Determine filename
-        if anomaly_type == 'ecg':
-            filename = f"anomalies_{today}.json"
-        elif anomaly_type == 'piezo':
-            filename = f"piezo_anomalies_{today}.json"
-        elif anomaly_type == 'temp':
-            filename = f"temp_anomalies_{today}.json"
+        if anomaly_type == 'temp':
+            # The detector's live log: it holds log_lock while it rewrites its
+            # active record in place, so append under the same lock
+            filepath = self._log_path(anomaly_type, today, ".jsonl")
+            with open(filepath, 'ab') as f, log_lock(f):
+                f.write(record + b'\n')
         else:
-            raise ValueError(f"Invalid anomaly type: {anomaly_type}")
+            filepath = self._log_path(anomaly_type, today, ".json")
+            self._append_to_array(filepath, record)
         
-        filepath = self.anomaly_logs_dir / filename
+        print(f"[Simulator] Saved {anomaly_type.upper()} anomaly to {filepath.name}")
+        return True
+    
+    @staticmethod
+    def _append_to_array(filepath, record):
+        """
+        Append one encoded record to a JSON array file in place: the closing
+        ']' is overwritten with ',<record>]' (no load + rewrite of the array)
+        """
+        try:
+            f = open(filepath, 'r+b')
+        except FileNotFoundError:
+            with open(filepath, 'wb') as f:
+                f.write(b'[' + record + b']')
+            return
         
-        # Load existing anomalies
-        if filepath.exists():
-            with open(filepath, 'r') as f:
-                anomalies = json.load(f)
-        else:
-            anomalies = []
+        with f:
+            close, last = AnomalySimulator._last_byte(f, f.seek(0, io.SEEK_END))
+            if close is None:
+                # Empty or whitespace-only file: start a new array
+                f.seek(0)
+                f.write(b'[' + record + b']')
+                f.truncate()
+                return
+            if last != b']':
+                raise ValueError(f"{filepath.name} is not a JSON array")
+            
+            _, prev = AnomalySimulator._last_byte(f, close)
+            f.seek(close)
+            f.write((b'' if prev == b'[' else b',') + record + b']')
+            f.truncate()
+    
+    @staticmethod
+    def _last_byte(f, pos, block=256):
+        """
+        Offset and value of the last non-whitespace byte before offset pos,
+        reading backwards block bytes at a time; (None, b'') if there is none
+        """
+        while pos > 0:
+            start = max(0, pos - block)
+            f.seek(start)
+            chunk = f.read(pos - start).rstrip()
+            if chunk:
+                return start + len(chunk) - 1, chunk[-1:]
+            pos = start
+        return None, b''
+    
+    def load_anomalies(self, anomaly_type, date=None):
+        """
+        Load the anomalies of a day (default today): JSON array file (ECG,
+        PIEZO, older TEMP days) and/or JSON Lines file (TEMP)
         
-        # Append new anomaly
-        anomalies.append(anomaly_data)
+        Returns:
+            list: Anomaly dicts
+        """
+        date = date or datetime.now().strftime("%Y%m%d")
+        anomalies = []
         
-        # Save back to file
-        with open(filepath, 'w') as f:
-            json.dump(anomalies, f, indent=2)
+        legacy = self._log_path(anomaly_type, date, ".json")
+        if legacy.exists():
+            with open(legacy, 'r') as f:
+                data = json.load(f)
+            if isinstance(data, list):
+                anomalies.extend(data)
         
-        print(f"[Simulator] Saved {anomaly_type.upper()} anomaly to {filename}")
-        return True
+        filepath = self._log_path(anomaly_type, date, ".jsonl")
+        if filepath.exists():
+            with open(filepath, 'rb') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        try:
+                            anomalies.append(json.loads(line))
+                        except ValueError:
+                            continue
+        
+        return anomalies
 
 
 def main():
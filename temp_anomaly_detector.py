@@ -5,14 +5,80 @@ Monitors temperature data in real-time and logs anomalies based on:
 - Hypothermia: Temperature < 35°C for sustained period
 - Hyperthermia: Temperature > 37.5°C for sustained period
 """
+import atexit
+import bisect
+import io
 import json
 import csv
+import os
+import queue
+import re
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import threading
-import queue
 from collections import deque
+from contextlib import contextmanager
+from operator import itemgetter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # not on Windows: log writers are then unsynchronized
+
+# temp_anomalies_YYYYMMDD.{json,jsonl,csv}
+_LOG_RE = re.compile(r'temp_anomalies_(\d{8})\.(?:json|jsonl|csv)$')
+
+# CSV log columns (same names as the log entry keys)
+_CSV_FIELDS = ('timestamp', 'date', 'time',
+               'anomaly_type', 'temperature', 'threshold',
+               'duration_readings', 'severity')
+_csv_row = itemgetter(*_CSV_FIELDS)
+
+# Severity bands: sorted cut points + label per band (see temperature_severity)
+_HYPO_CUTS = (32.0, 34.0)
+_HYPO_LABELS = ("severe", "moderate", "mild")
+_HYPER_CUTS = (39.0, 40.0)
+_HYPER_LABELS = ("mild", "moderate", "severe")
+
+
+def _severity_hypo(temp: float) -> str:
+    """Hypothermia severity: < 32 severe, < 34 moderate"""
+    return _HYPO_LABELS[bisect.bisect_right(_HYPO_CUTS, temp)]
+
+
+def _severity_hyper(temp: float) -> str:
+    """Hyperthermia severity: > 40 severe, > 39 moderate"""
+    return _HYPER_LABELS[bisect.bisect_left(_HYPER_CUTS, temp)]
+
+
+# Anomaly type -> severity function (anything else is graded as hyperthermia)
+_SEVERITY_BY_TYPE = {"hypothermia": _severity_hypo, "hyperthermia": _severity_hyper}
+
+
+def temperature_severity(temp: float, anomaly_type: str) -> str:
+    """
+    Severity of a temperature anomaly: "mild", "moderate" or "severe"
+    Hypothermia: < 32 severe, < 34 moderate; hyperthermia: > 40 severe, > 39 moderate
+    """
+    return _SEVERITY_BY_TYPE.get(anomaly_type, _severity_hyper)(temp)
+
+
+@contextmanager
+def log_lock(fh):
+    """
+    Exclusive advisory lock on a temperature anomaly log, which the detector
+    rewrites in place and the anomaly simulator appends to (no-op without fcntl)
+    """
+    if fcntl is None:
+        yield
+        return
+    fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+    try:
+        yield
+    finally:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
 
 
 class TemperatureAnomalyDetector:
@@ -41,21 +107,33 @@ class TemperatureAnomalyDetector:
         self.min_duration = min_duration
         self.log_format = log_format.lower()
         self.notification_callback = notification_callback
+        # Notifications go through a small queue to their own daemon thread
+        # (started on first use), so a slow callback never stalls detection
+        self._notify_q = queue.SimpleQueue()
+        self.max_pending_notifications = 32
+        self._notify_thread = None
         
         # State tracking
-        self.temp_buffer = deque(maxlen=min_duration * 2)
+        # Last readings for get_current_state
+        self._recent_buf = deque(maxlen=min(5, min_duration * 2))
         self.consecutive_hypo = 0
         self.consecutive_hyper = 0
         
-        # Track current active anomaly
+        # Track current active anomaly (byte offset of its record, always the
+        # last one in the log, so updates rewrite it in place)
         self.current_anomaly_type = None
-        self.current_anomaly_index = None
+        self._current_anomaly_offset = None
+        self._current_anomaly_entry = None
+        self._current_anomaly_end = None
         
         # Statistics
+        # Single writer: only the worker thread calls detect_anomaly, so state is
+        # mutated without a lock; readers use the snapshot it rebinds after each
+        # reading (one attribute store, atomic under the GIL)
         self.total_readings = 0
         self.hypo_anomalies = 0
         self.hyper_anomalies = 0
-        self.lock = threading.Lock()
+        self._publish_snapshot()
         
         # Setup logging
         self._setup_logging()
@@ -72,10 +150,10 @@ class TemperatureAnomalyDetector:
         today = datetime.now().strftime("%Y%m%d")
         
         if self.log_format == "json":
-            self.log_file = self.log_dir / f"temp_anomalies_{today}.json"
+            # JSON Lines: one compact record per line, appended
+            self.log_file = self.log_dir / f"temp_anomalies_{today}.jsonl"
             if not self.log_file.exists():
-                with open(self.log_file, 'w') as f:
-                    json.dump([], f)
+                self.log_file.touch()
                 print(f"[TEMP Anomaly] Created new log file: {self.log_file}")
             else:
                 print(f"[TEMP Anomaly] Appending to existing log file: {self.log_file}")
@@ -84,161 +162,184 @@ class TemperatureAnomalyDetector:
             if not self.log_file.exists():
                 with open(self.log_file, 'w', newline='') as f:
                     writer = csv.writer(f)
-                    writer.writerow([
-                        'timestamp', 'date', 'time', 
-                        'anomaly_type', 'temperature', 'threshold',
-                        'duration_readings', 'severity'
-                    ])
+                    writer.writerow(_CSV_FIELDS)
                 print(f"[TEMP Anomaly] Created new log file: {self.log_file}")
             else:
                 print(f"[TEMP Anomaly] Appending to existing log file: {self.log_file}")
+            
+            # One writer over a reused in-memory buffer formats each row
+            self._csv_buf = io.StringIO()
+            self._csv_writer = csv.writer(self._csv_buf)
+        
+        # Kept open for the detector's lifetime (see _write_record); unbuffered,
+        # so each record is one write() straight to the file, no flush needed
+        self._log_fh = open(self.log_file, 'r+b', buffering=0)
+        atexit.register(self.close)
+    
+    def close(self):
+        """Close the anomaly log file and let the notifier finish its queue"""
+        if self._notify_thread is not None:
+            self._notify_q.put(None)
+            self._notify_thread = None
+        if self._log_fh is not None:
+            self._log_fh.close()
+            self._log_fh = None
     
     def _clean_old_logs(self):
         """Delete log files older than 10 days"""
-        cutoff_date = datetime.now() - timedelta(days=10)
+        # YYYYMMDD compares correctly as an integer: no strptime per file
+        # (<= keeps the old rule: a file dated on the cutoff day is already older)
+        cutoff = int((datetime.now() - timedelta(days=10)).strftime("%Y%m%d"))
         deleted_count = 0
         
-        for log_file in self.log_dir.glob("temp_anomalies_*.json"):
-            try:
-                date_str = log_file.stem.split('_')[2]
-                file_date = datetime.strptime(date_str, "%Y%m%d")
-                
-                if file_date < cutoff_date:
-                    log_file.unlink()
+        # One directory pass for all formats (.json, .jsonl, .csv)
+        with os.scandir(self.log_dir) as entries:
+            for entry in entries:
+                m = _LOG_RE.match(entry.name)
+                if m and int(m.group(1)) <= cutoff:
+                    try:
+                        os.unlink(entry.path)
+                    except OSError:
+                        continue
                     deleted_count += 1
-                    print(f"[TEMP Anomaly] Deleted old log: {log_file.name}")
-            except (ValueError, IndexError):
-                pass
-        
-        for log_file in self.log_dir.glob("temp_anomalies_*.csv"):
-            try:
-                date_str = log_file.stem.split('_')[2]
-                file_date = datetime.strptime(date_str, "%Y%m%d")
-                
-                if file_date < cutoff_date:
-                    log_file.unlink()
-                    deleted_count += 1
-                    print(f"[TEMP Anomaly] Deleted old log: {log_file.name}")
-            except (ValueError, IndexError):
-                pass
+                    print(f"[TEMP Anomaly] Deleted old log: {entry.name}")
         
         if deleted_count > 0:
             print(f"[TEMP Anomaly] Cleaned {deleted_count} old log file(s)")
     
-    def _calculate_severity(self, temp: float, anomaly_type: str) -> str:
-        """
-        Calculate severity of temperature anomaly
-        
-        Returns: "mild", "moderate", or "severe"
-        """
-        if anomaly_type == "hypothermia":
-            if temp < 32.0:
-                return "severe"
-            elif temp < 34.0:
-                return "moderate"
-            else:
-                return "mild"
-        else:
-            if temp > 40.0:
-                return "severe"
-            elif temp > 39.0:
-                return "moderate"
-            else:
-                return "mild"
-    
-    def detect_anomaly(self, temperature: float) -> Optional[Dict]:
+    def detect_anomaly(self, temperature: float, timestamp: Optional[float] = None) -> Optional[Dict]:
         """
         Detect if temperature reading indicates an anomaly
         
         Args:
             temperature: Temperature in Celsius
+            timestamp: Epoch time the reading arrived (time.time()), default now
             
         Returns:
             Dictionary with detection results if anomaly detected, None otherwise
         """
-        with self.lock:
-            self.total_readings += 1
-            now = datetime.now()
-            
-            self.temp_buffer.append({
-                'temp': temperature,
-                'timestamp': now
-            })
-            
-            anomaly_detected = False
-            anomaly_type = None
-            is_new_anomaly = False
-            
-            # Check for hypothermia (< 35°C)
-            if temperature < self.hypo_threshold:
-                self.consecutive_hypo += 1
-                self.consecutive_hyper = 0
-                
-                if self.consecutive_hypo >= self.min_duration:
-                    anomaly_detected = True
-                    anomaly_type = "hypothermia"
-                    
-                    if self.current_anomaly_type != "hypothermia":
-                        is_new_anomaly = True
-                        self.hypo_anomalies += 1
-                        self.current_anomaly_type = "hypothermia"
+        try:
+            return self._detect_one(temperature, time.time() if timestamp is None else timestamp)
+        finally:
+            self._publish_snapshot()
+    
+    def detect_anomaly_batch(self, readings: List[Tuple[float, float]]) -> List[Dict]:
+        """
+        Detect anomalies over a burst of (timestamp, temperature) readings
+        (e.g. a backlog drained by the worker), publishing the snapshot once
+        
+        Returns:
+            Detection results of the readings that were anomalous
+        """
+        detect_one = self._detect_one
+        try:
+            return [result for result in (detect_one(t, ts) for ts, t in readings)
+                    if result is not None]
+        finally:
+            self._publish_snapshot()
+    
+    def _detect_one(self, temperature: float, ts: float) -> Optional[Dict]:
+        """Process one reading taken at epoch time ts (worker thread; snapshot not published)"""
+        self.total_readings += 1
+        
+        self._recent_buf.append(temperature)
+        
+        # Each anomalous branch fixes type, counter, threshold and severity
+        # function, so nothing below re-compares the type string
+        anomaly_type = None
+        is_new_anomaly = False
+        
+        # Check for hypothermia (< 35°C)
+        if temperature < self.hypo_threshold:
+            self.consecutive_hypo += 1
+            self.consecutive_hyper = 0
             
-            # Check for hyperthermia (> 37.5°C)
-            elif temperature > self.hyper_threshold:
-                self.consecutive_hyper += 1
-                self.consecutive_hypo = 0
+            if self.consecutive_hypo >= self.min_duration:
+                anomaly_type = "hypothermia"
+                consecutive = self.consecutive_hypo
+                threshold = self.hypo_threshold
+                severity_fn = _severity_hypo
                 
-                if self.consecutive_hyper >= self.min_duration:
-                    anomaly_detected = True
-                    anomaly_type = "hyperthermia"
-                    
-                    if self.current_anomaly_type != "hyperthermia":
-                        is_new_anomaly = True
-                        self.hyper_anomalies += 1
-                        self.current_anomaly_type = "hyperthermia"
+                if self.current_anomaly_type != "hypothermia":
+                    is_new_anomaly = True
+                    self.hypo_anomalies += 1
+                    self.current_anomaly_type = "hypothermia"
+        
+        # Check for hyperthermia (> 37.5°C)
+        elif temperature > self.hyper_threshold:
+            self.consecutive_hyper += 1
+            self.consecutive_hypo = 0
             
-            # Normal temperature - end current anomaly if any
-            else:
-                if self.current_anomaly_type is not None:
-                    print(f"\n[TEMP Anomaly] {self.current_anomaly_type.upper()} ENDED\n")
+            if self.consecutive_hyper >= self.min_duration:
+                anomaly_type = "hyperthermia"
+                consecutive = self.consecutive_hyper
+                threshold = self.hyper_threshold
+                severity_fn = _severity_hyper
                 
-                self.consecutive_hypo = 0
-                self.consecutive_hyper = 0
-                self.current_anomaly_type = None
-                self.current_anomaly_index = None
-            
-            if not anomaly_detected:
-                return None
-            
-            consecutive = self.consecutive_hypo if anomaly_type == "hypothermia" else self.consecutive_hyper
-            severity = self._calculate_severity(temperature, anomaly_type)
-            threshold = self.hypo_threshold if anomaly_type == "hypothermia" else self.hyper_threshold
-            
-            if is_new_anomaly:
-                self._log_new_anomaly(anomaly_type, temperature, threshold, consecutive, severity, now)
-            else:
-                self._update_existing_anomaly(anomaly_type, temperature, consecutive, severity, now)
-            
-            result = {
-                'is_anomaly': True,
-                'is_new': is_new_anomaly,
-                'anomaly_type': anomaly_type,
-                'temperature': temperature,
-                'threshold': threshold,
-                'consecutive_readings': consecutive,
-                'severity': severity,
-                'timestamp': now.isoformat()
-            }
+                if self.current_anomaly_type != "hyperthermia":
+                    is_new_anomaly = True
+                    self.hyper_anomalies += 1
+                    self.current_anomaly_type = "hyperthermia"
+        
+        # Normal temperature - end current anomaly if any
+        else:
+            if self.current_anomaly_type is not None:
+                print(f"\n[TEMP Anomaly] {self.current_anomaly_type.upper()} ENDED\n")
             
-            return result
+            self.consecutive_hypo = 0
+            self.consecutive_hyper = 0
+            self.current_anomaly_type = None
+            self._current_anomaly_offset = None
+        
+        if anomaly_type is None:
+            return None
+        
+        severity = severity_fn(temperature)
+        
+        # Only anomalous readings get a datetime: format it once, date and
+        # time are slices of it
+        iso = datetime.fromtimestamp(ts).isoformat()
+        date_str = iso[:10]
+        time_str = iso[11:19]
+        
+        if is_new_anomaly:
+            self._log_new_anomaly(anomaly_type, temperature, threshold, consecutive, severity,
+                                  iso, date_str, time_str)
+        else:
+            self._update_existing_anomaly(anomaly_type, temperature, consecutive, severity,
+                                          iso, time_str)
+        
+        result = {
+            'is_anomaly': True,
+            'is_new': is_new_anomaly,
+            'anomaly_type': anomaly_type,
+            'temperature': temperature,
+            'threshold': threshold,
+            'consecutive_readings': consecutive,
+            'severity': severity,
+            'timestamp': iso
+        }
+        
+        return result
+    
+    def _publish_snapshot(self):
+        """Publish the counters for lock-free readers (worker thread only)"""
+        self._snapshot = {
+            'total_readings': self.total_readings,
+            'hypo_anomalies': self.hypo_anomalies,
+            'hyper_anomalies': self.hyper_anomalies,
+            'consecutive_hypo': self.consecutive_hypo,
+            'consecutive_hyper': self.consecutive_hyper,
+            'active_anomaly': self.current_anomaly_type
+        }
     
     def _log_new_anomaly(self, anomaly_type: str, temperature: float, threshold: float, 
-                         consecutive: int, severity: str, now: datetime):
+                         consecutive: int, severity: str, iso: str, date_str: str, time_str: str):
         """Log new anomaly to file"""
         log_entry = {
-            'timestamp': now.isoformat(),
-            'date': now.strftime("%Y-%m-%d"),
-            'time': now.strftime("%H:%M:%S"),
+            'timestamp': iso,
+            'date': date_str,
+            'time': time_str,
             'anomaly_type': anomaly_type,
             'temperature': temperature,
             'threshold': threshold,
@@ -246,28 +347,13 @@ class TemperatureAnomalyDetector:
             'severity': severity
         }
         
-        if self.log_format == "json":
-            with open(self.log_file, 'r') as f:
-                data = json.load(f)
-            
-            data.append(log_entry)
-            self.current_anomaly_index = len(data) - 1
-            
-            with open(self.log_file, 'w') as f:
-                json.dump(data, f, indent=2)
-        else:
-            with open(self.log_file, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([
-                    log_entry['timestamp'],
-                    log_entry['date'],
-                    log_entry['time'],
-                    log_entry['anomaly_type'],
-                    log_entry['temperature'],
-                    log_entry['threshold'],
-                    log_entry['duration_readings'],
-                    log_entry['severity']
-                ])
+        fh = self._log_fh
+        with log_lock(fh):
+            fh.seek(0, io.SEEK_END)
+            self._current_anomaly_offset = fh.tell()
+            self._current_anomaly_entry = log_entry
+            self._write_record(log_entry)
+            self._current_anomaly_end = fh.tell()
         
         emoji = "🥶" if anomaly_type == "hypothermia" else "🥵"
         print(f"\n[TEMP Anomaly] {emoji} {anomaly_type.upper()} DETECTED at {log_entry['time']}")
@@ -276,7 +362,7 @@ class TemperatureAnomalyDetector:
         
         # Send notification
         if self.notification_callback:
-            self.notification_callback('temp', {
+            self._notify({
                 'time': log_entry['time'],
                 'anomaly_type': anomaly_type,
                 'temperature': temperature,
@@ -284,80 +370,109 @@ class TemperatureAnomalyDetector:
                 'severity': severity
             })
     
+    def _notify(self, payload: Dict):
+        """Queue a notification for the notifier thread (never blocks)"""
+        if self._notify_q.qsize() >= self.max_pending_notifications:
+            print("[TEMP Anomaly] Notification queue full, dropping notification")
+            return
+        if self._notify_thread is None:
+            self._notify_thread = threading.Thread(target=self._notify_loop, daemon=True)
+            self._notify_thread.start()
+        self._notify_q.put((self.notification_callback, 'temp', payload))
+    
+    def _notify_loop(self):
+        """Deliver queued notifications until close() queues None"""
+        while True:
+            item = self._notify_q.get()
+            if item is None:
+                return
+            callback, kind, payload = item
+            try:
+                callback(kind, payload)
+            except Exception as e:
+                print(f"[TEMP Anomaly] Notification error: {e}")
+    
     def _update_existing_anomaly(self, anomaly_type: str, temperature: float, 
-                                  consecutive: int, severity: str, now: datetime):
+                                  consecutive: int, severity: str, iso: str, time_str: str):
         """Update existing anomaly in log file"""
-        if self.current_anomaly_index is None:
+        if self._current_anomaly_offset is None:
             return
         
-        if self.log_format == "json":
-            with open(self.log_file, 'r') as f:
-                data = json.load(f)
-            
-            if self.current_anomaly_index < len(data):
-                data[self.current_anomaly_index]['temperature'] = temperature
-                data[self.current_anomaly_index]['duration_readings'] = consecutive
-                data[self.current_anomaly_index]['severity'] = severity
-                data[self.current_anomaly_index]['timestamp'] = now.isoformat()
-                data[self.current_anomaly_index]['time'] = now.strftime("%H:%M:%S")
-                
-                with open(self.log_file, 'w') as f:
-                    json.dump(data, f, indent=2)
-        else:
-            with open(self.log_file, 'r', newline='') as f:
-                reader = csv.reader(f)
-                rows = list(reader)
-            
-            if len(rows) > 1:
-                rows[-1] = [
-                    now.isoformat(),
-                    now.strftime("%Y-%m-%d"),
-                    now.strftime("%H:%M:%S"),
-                    anomaly_type,
-                    temperature,
-                    self.hypo_threshold if anomaly_type == "hypothermia" else self.hyper_threshold,
-                    consecutive,
-                    severity
-                ]
-                
-                with open(self.log_file, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerows(rows)
+        log_entry = self._current_anomaly_entry
+        log_entry['temperature'] = temperature
+        log_entry['duration_readings'] = consecutive
+        log_entry['severity'] = severity
+        log_entry['timestamp'] = iso
+        log_entry['time'] = time_str
+        
+        # The active anomaly is the last record: overwrite it from its offset
+        # and cut whatever the previous version left behind. The lock keeps the
+        # simulator from appending between the end check and the truncate
+        fh = self._log_fh
+        with log_lock(fh):
+            end = fh.seek(0, io.SEEK_END)
+            if end != self._current_anomaly_end:
+                # Someone else appended after it (e.g. the anomaly simulator):
+                # turn the old copy into empty lines, which both JSON Lines and
+                # csv readers skip (spaces would leave a whitespace-only CSV
+                # row), and re-append the record at the end
+                fh.seek(self._current_anomaly_offset)
+                fh.write(b'\n' * (self._current_anomaly_end - self._current_anomaly_offset))
+                self._current_anomaly_offset = end
+            fh.seek(self._current_anomaly_offset)
+            self._write_record(log_entry)
+            self._current_anomaly_end = fh.tell()
+            fh.truncate()
         
         if consecutive % 10 == 0:
             emoji = "🥶" if anomaly_type == "hypothermia" else "🥵"
             print(f"[TEMP Anomaly] {emoji} {anomaly_type.upper()} continuing... "
                   f"{consecutive} readings - Severity: {severity}")
     
+    def _write_record(self, log_entry: Dict):
+        """Write one log record (JSON line or CSV row) at the current file position"""
+        if self.log_format == "json":
+            line = json.dumps(log_entry, separators=(',', ':')).encode('utf-8') + b'\n'
+        else:
+            buf = self._csv_buf
+            buf.seek(0)
+            buf.truncate()
+            self._csv_writer.writerow(_csv_row(log_entry))
+            line = buf.getvalue().encode('utf-8')
+        
+        self._log_fh.write(line)
+    
     def get_statistics(self) -> Dict:
         """Get detection statistics"""
-        with self.lock:
-            return {
-                'sensor': 'TEMPERATURE',
-                'total_readings': self.total_readings,
-                'hypothermia_anomalies': self.hypo_anomalies,
-                'hyperthermia_anomalies': self.hyper_anomalies,
-                'total_anomalies': self.hypo_anomalies + self.hyper_anomalies,
-                'hypo_threshold': self.hypo_threshold,
-                'hyper_threshold': self.hyper_threshold,
-                'min_duration': self.min_duration,
-                'log_file': str(self.log_file),
-                'active_anomaly': self.current_anomaly_type
-            }
+        snapshot = self._snapshot
+        return {
+            'sensor': 'TEMPERATURE',
+            'total_readings': snapshot['total_readings'],
+            'hypothermia_anomalies': snapshot['hypo_anomalies'],
+            'hyperthermia_anomalies': snapshot['hyper_anomalies'],
+            'total_anomalies': snapshot['hypo_anomalies'] + snapshot['hyper_anomalies'],
+            'hypo_threshold': self.hypo_threshold,
+            'hyper_threshold': self.hyper_threshold,
+            'min_duration': self.min_duration,
+            'log_file': str(self.log_file),
+            'active_anomaly': snapshot['active_anomaly']
+        }
     
     def get_current_state(self) -> Dict:
         """Get current detector state"""
-        with self.lock:
-            recent_temps = [entry['temp'] for entry in list(self.temp_buffer)[-5:]]
-            avg_temp = sum(recent_temps) / len(recent_temps) if recent_temps else None
-            
-            return {
-                'consecutive_hypo': self.consecutive_hypo,
-                'consecutive_hyper': self.consecutive_hyper,
-                'recent_temperatures': recent_temps,
-                'average_recent': avg_temp,
-                'active_anomaly_type': self.current_anomaly_type
-            }
+        snapshot = self._snapshot
+        # list(deque) copies in one C call, so it never sees a half-done append;
+        # the average comes from that same copy
+        recent_temps = list(self._recent_buf)
+        avg_temp = sum(recent_temps) / len(recent_temps) if recent_temps else None
+        
+        return {
+            'consecutive_hypo': snapshot['consecutive_hypo'],
+            'consecutive_hyper': snapshot['consecutive_hyper'],
+            'recent_temperatures': recent_temps,
+            'average_recent': avg_temp,
+            'active_anomaly_type': snapshot['active_anomaly']
+        }
 
 
 class TemperatureAnomalyWorker:
@@ -371,7 +486,11 @@ class TemperatureAnomalyWorker:
             detector: TemperatureAnomalyDetector instance
         """
         self.detector = detector
-        self.data_queue = queue.Queue(maxsize=100)
+        # Single producer / single consumer: deque append/popleft are atomic,
+        # the event only wakes the worker when it has drained everything
+        self.data_queue = deque()
+        self.max_queue_size = 100
+        self._wake = threading.Event()
         self.stop_event = threading.Event()
         self.worker_thread = None
         
@@ -385,29 +504,42 @@ class TemperatureAnomalyWorker:
     def stop(self):
         """Stop the background worker"""
         self.stop_event.set()
+        self._wake.set()
         if self.worker_thread:
             self.worker_thread.join(timeout=2.0)
+        self.detector.close()
         print("[TEMP Anomaly] Worker stopped")
     
     def add_temperature(self, temp_celsius: float):
         """
-        Add temperature reading to processing queue
+        Add temperature reading to processing queue, stamped with its arrival time
         
         Args:
             temp_celsius: Temperature in Celsius
         """
-        try:
-            self.data_queue.put_nowait(temp_celsius)
-        except queue.Full:
+        if len(self.data_queue) >= self.max_queue_size:
             print("[TEMP Anomaly] Queue full, dropping reading")
+            return
+        self.data_queue.append((time.time(), temp_celsius))
+        self._wake.set()
     
     def _worker_loop(self):
         """Main worker loop"""
+        data_queue = self.data_queue
+        batch = []  # reused across wakeups
         while not self.stop_event.is_set():
-            try:
-                temp = self.data_queue.get(timeout=0.5)
-                self.detector.detect_anomaly(temp)
-            except queue.Empty:
+            # Clear before draining: a reading appended meanwhile sets it again
+            self._wake.wait(0.5)
+            self._wake.clear()
+            
+            # Everything queued since the last wakeup is processed as one batch
+            while data_queue:
+                batch.append(data_queue.popleft())
+            if not batch:
                 continue
+            
+            try:
+                self.detector.detect_anomaly_batch(batch)
             except Exception as e:
-                print(f"[TEMP Anomaly] Worker error: {e}")
\ No newline at end of file
+                print(f"[TEMP Anomaly] Worker error: {e}")
+            batch.clear()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from simulate_anomaly import AnomalySimulator
+
+
+def _append(path, record):
+    AnomalySimulator._append_to_array(path, json.dumps(record).encode())
+
+
+def test_append_keeps_records_before_long_whitespace_tail(tmp_path):
+    path = tmp_path / "anomalies_20250101.json"
+    records = [{"i": i} for i in range(5)]
+    path.write_text(json.dumps(records, indent=2) + "\n" * 300)
+
+    _append(path, {"new": 1})
+
+    assert json.loads(path.read_text()) == records + [{"new": 1}]
+
+
+def test_append_to_empty_array_with_whitespace_before_bracket(tmp_path):
+    path = tmp_path / "anomalies_20250101.json"
+    path.write_text("[" + " " * 600 + "]\n")
+
+    _append(path, {"new": 1})
+
+    assert json.loads(path.read_text()) == [{"new": 1}]
+
+
+@pytest.mark.parametrize("content", ["", "\n" * 300])
+def test_append_starts_array_in_blank_file(tmp_path, content):
+    path = tmp_path / "anomalies_20250101.json"
+    path.write_text(content)
+
+    _append(path, {"new": 1})
+
+    assert json.loads(path.read_text()) == [{"new": 1}]
+
+
+def test_append_creates_missing_file(tmp_path):
+    path = tmp_path / "anomalies_20250101.json"
+
+    _append(path, {"new": 1})
+
+    assert json.loads(path.read_text()) == [{"new": 1}]
+
+
+def test_append_rejects_non_array(tmp_path):
+    path = tmp_path / "anomalies_20250101.json"
+    path.write_text('{"a": 1}' + "\n" * 300)
+
+    with pytest.raises(ValueError):
+        _append(path, {"new": 1})
+    assert path.read_text() == '{"a": 1}' + "\n" * 300